@@ -15,8 +15,11 @@ INTENTS.voice_states = True  # needed for voice state tracking (even if you don'
 
 EXTENSIONS = [
     "cogs.config",
+    "cogs.permissions",  # before any cog that imports its permission tiers
+    "cogs.scheduler",  # before cogs that register timers
     "cogs.sync_cmds",
     "cogs.rebuild_server",
+    "cogs.raid_guard",
     "cogs.verification",
     "cogs.welcome",
     "cogs.role_select",
@@ -1,12 +1,16 @@
 import asyncio
-import sqlite3
 import time
-import json
 from typing import Optional, List, Tuple
 
 import discord
 from discord import app_commands
-from discord.ext import commands, tasks
+from discord.ext import commands
+
+from cogs.permissions import is_staff
+from cogs.bot_db import get_db
+from cogs.scheduler import scheduler
+from cogs.migrations import migrate_bot_db
+from cogs.overwrites import reconcile, banned_plan, muted_plan
 
 BRAND_GREEN = discord.Colour.from_rgb(46, 204, 113)
 
@@ -14,107 +18,59 @@ APPEALS_CHANNEL_NAME = "appeals"
 MODLOG_NAME = "mod-log"
 BANNED_CHANNEL_NAME = "banned"
 DB_PATH = "bot.db"
-
-ADMIN_ROLE_ID = 1450553389971800185
+db = get_db(DB_PATH)
 
 APPEAL_WINDOW_SECONDS = 30 * 24 * 60 * 60  # 30 days
 MAX_APPEALS_TOTAL = 2  # 2 total attempts (2nd via website later)
 PERMABAN_DELAY_SECONDS = 30  # after decline, DM then ban after ~30s
 
+# (guild_id, user_id) of every quarantine row, so joins/leaves only hit the db on a match.
+# Loaded in setup() and kept in sync by _upsert_quarantine / _delete_quarantine.
+_quarantined: set[tuple[int, int]] = set()
+
+
+def _saved_roles(con, table: str, guild_id: int, user_id: int) -> List[int]:
+    return [r[0] for r in con.execute(f"SELECT role_id FROM {table} WHERE guild_id=? AND user_id=?", (guild_id, user_id))]
+
+
+def _replace_saved_roles(con, table: str, guild_id: int, user_id: int, roles: List[int]):
+    con.execute(f"DELETE FROM {table} WHERE guild_id=? AND user_id=?", (guild_id, user_id))
+    con.executemany(f"INSERT OR IGNORE INTO {table}(guild_id,user_id,role_id) VALUES(?,?,?)",
+                    [(guild_id, user_id, int(rid)) for rid in roles])
+
+
+async def _get_quarantine(guild_id: int, user_id: int):
+    # row[2] is the list of saved role ids (from quarantine_roles)
+    def get(con):
+        row = con.execute("""SELECT guild_id,user_id,banned_by,ban_reason,created_at,appeal_count,last_appeal_at,last_appeal_text,
+                                    last_decision,last_decision_by,last_decision_at
+                             FROM quarantine_bans WHERE guild_id=? AND user_id=?""", (guild_id, user_id)).fetchone()
+        if not row:
+            return None
+        return row[:2] + (_saved_roles(con, "quarantine_roles", guild_id, user_id),) + row[2:]
+    return await db.run(get)
 
-def _is_staff(member: discord.Member) -> bool:
-    if member.guild_permissions.administrator:
-        return True
-    if member.guild_permissions.moderate_members or member.guild_permissions.kick_members or member.guild_permissions.ban_members:
-        return True
-    return any(r.id == ADMIN_ROLE_ID for r in member.roles)
-
-
-def _ensure_db():
-    con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
-
-    cur.execute("""CREATE TABLE IF NOT EXISTS quarantine_bans(
-        guild_id INTEGER NOT NULL,
-        user_id INTEGER NOT NULL,
-        roles_json TEXT NOT NULL,
-        banned_by INTEGER NOT NULL,
-        ban_reason TEXT,
-        created_at INTEGER NOT NULL,
-        appeal_count INTEGER NOT NULL DEFAULT 0,
-        last_appeal_at INTEGER,
-        last_appeal_text TEXT,
-        last_decision TEXT,
-        last_decision_by INTEGER,
-        last_decision_at INTEGER,
-        PRIMARY KEY (guild_id, user_id)
-    )""")
-
-    cur.execute("""CREATE TABLE IF NOT EXISTS rejoin_abuse(
-        guild_id INTEGER NOT NULL,
-        user_id INTEGER NOT NULL,
-        rejoin_count INTEGER NOT NULL DEFAULT 0,
-        last_rejoin_at INTEGER,
-        PRIMARY KEY (guild_id, user_id)
-    )""")
-
-    cur.execute("""CREATE TABLE IF NOT EXISTS scheduled_permabans(
-        guild_id INTEGER NOT NULL,
-        user_id INTEGER NOT NULL,
-        execute_at INTEGER NOT NULL,
-        reason TEXT,
-        banned_by INTEGER NOT NULL,
-        PRIMARY KEY (guild_id, user_id)
-    )""")
-
-    cur.execute("""CREATE TABLE IF NOT EXISTS mutes(
-        guild_id INTEGER NOT NULL,
-        user_id INTEGER NOT NULL,
-        ends_at INTEGER NOT NULL,
-        roles_json TEXT NOT NULL,
-        reason TEXT,
-        muted_by INTEGER NOT NULL,
-        PRIMARY KEY (guild_id, user_id)
-    )""")
-
-    con.commit()
-    con.close()
-
-
-def _get_quarantine(guild_id: int, user_id: int):
-    con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
-    cur.execute("""SELECT guild_id,user_id,roles_json,banned_by,ban_reason,created_at,appeal_count,last_appeal_at,last_appeal_text,
-                          last_decision,last_decision_by,last_decision_at
-                   FROM quarantine_bans WHERE guild_id=? AND user_id=?""",
-                (guild_id, user_id))
-    row = cur.fetchone()
-    con.close()
-    return row
-
-
-def _upsert_quarantine(guild_id: int, user_id: int, roles: List[int], banned_by: int, ban_reason: str):
-    now = int(time.time())
-    con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
-    cur.execute("""INSERT INTO quarantine_bans(guild_id,user_id,roles_json,banned_by,ban_reason,created_at,appeal_count,last_appeal_at,last_appeal_text,last_decision,last_decision_by,last_decision_at)
-                   VALUES(?,?,?,?,?,?,0,NULL,NULL,NULL,NULL,NULL)
-                   ON CONFLICT(guild_id,user_id) DO UPDATE SET
-                        roles_json=excluded.roles_json,
-                        banned_by=excluded.banned_by,
-                        ban_reason=excluded.ban_reason,
-                        created_at=excluded.created_at
-                """,
-                (guild_id, user_id, json.dumps(roles), banned_by, ban_reason, now))
-    con.commit()
-    con.close()
 
+async def _upsert_quarantine(guild_id: int, user_id: int, roles: List[int], banned_by: int, ban_reason: str):
+    now = int(time.time())
 
-def _set_appeal_submitted(guild_id: int, user_id: int, appeal_text: str):
+    def upsert(con):
+        con.execute("""INSERT INTO quarantine_bans(guild_id,user_id,banned_by,ban_reason,created_at,appeal_count,last_appeal_at,last_appeal_text,last_decision,last_decision_by,last_decision_at)
+                       VALUES(?,?,?,?,?,0,NULL,NULL,NULL,NULL,NULL)
+                       ON CONFLICT(guild_id,user_id) DO UPDATE SET
+                            banned_by=excluded.banned_by,
+                            ban_reason=excluded.ban_reason,
+                            created_at=excluded.created_at
+                    """,
+                    (guild_id, user_id, banned_by, ban_reason, now))
+        _replace_saved_roles(con, "quarantine_roles", guild_id, user_id, roles)
+    await db.run(upsert)
+    _quarantined.add((guild_id, user_id))
+
+
+async def _set_appeal_submitted(guild_id: int, user_id: int, appeal_text: str):
     now = int(time.time())
-    con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
-    cur.execute("""UPDATE quarantine_bans
+    await db.execute("""UPDATE quarantine_bans
                    SET appeal_count=appeal_count+1,
                        last_appeal_at=?,
                        last_appeal_text=?,
@@ -123,26 +79,18 @@ def _set_appeal_submitted(guild_id: int, user_id: int, appeal_text: str):
                        last_decision_at=NULL
                    WHERE guild_id=? AND user_id=?""",
                 (now, appeal_text, guild_id, user_id))
-    con.commit()
-    con.close()
 
 
-def _set_decision(guild_id: int, user_id: int, decision: str, decision_by: int):
+async def _set_decision(guild_id: int, user_id: int, decision: str, decision_by: int):
     now = int(time.time())
-    con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
-    cur.execute("""UPDATE quarantine_bans
+    await db.execute("""UPDATE quarantine_bans
                    SET last_decision=?, last_decision_by=?, last_decision_at=?
                    WHERE guild_id=? AND user_id=?""",
                 (decision, decision_by, now, guild_id, user_id))
-    con.commit()
-    con.close()
 
 
-def _schedule_permaban(guild_id: int, user_id: int, execute_at: int, reason: str, banned_by: int):
-    con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
-    cur.execute("""INSERT INTO scheduled_permabans(guild_id,user_id,execute_at,reason,banned_by)
+async def _schedule_permaban(guild_id: int, user_id: int, execute_at: int, reason: str, banned_by: int):
+    await db.execute("""INSERT INTO scheduled_permabans(guild_id,user_id,execute_at,reason,banned_by)
                    VALUES(?,?,?,?,?)
                    ON CONFLICT(guild_id,user_id) DO UPDATE SET
                         execute_at=excluded.execute_at,
@@ -150,61 +98,59 @@ def _schedule_permaban(guild_id: int, user_id: int, execute_at: int, reason: str
                         banned_by=excluded.banned_by
                 """,
                 (guild_id, user_id, execute_at, reason, banned_by))
-    con.commit()
-    con.close()
+    scheduler.schedule("permaban", (guild_id, user_id), execute_at)
+
+
+async def _pop_due_permaban(guild_id: int, user_id: int, now_ts: int) -> Optional[Tuple[int, int, int, str, int]]:
+    def pop(con):
+        # select + delete in one transaction on the db thread
+        row = con.execute("""SELECT guild_id,user_id,execute_at,COALESCE(reason,''),banned_by
+                             FROM scheduled_permabans WHERE guild_id=? AND user_id=? AND execute_at<=?""",
+                          (guild_id, user_id, now_ts)).fetchone()
+        if row:
+            con.execute("DELETE FROM scheduled_permabans WHERE guild_id=? AND user_id=?", (guild_id, user_id))
+        return row
+    return await db.run(pop)
+
+
+async def _permaban_timers():
+    rows = await db.fetchall("SELECT execute_at,guild_id,user_id FROM scheduled_permabans")
+    return [(execute_at, (guild_id, user_id)) for execute_at, guild_id, user_id in rows]
 
 
-def _pop_due_permabans(now_ts: int) -> List[Tuple[int, int, int, str, int]]:
-    con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
-    cur.execute("""SELECT guild_id,user_id,execute_at,COALESCE(reason,''),banned_by
-                   FROM scheduled_permabans WHERE execute_at<=?""", (now_ts,))
-    rows = cur.fetchall()
-    cur.execute("DELETE FROM scheduled_permabans WHERE execute_at<=?", (now_ts,))
-    con.commit()
-    con.close()
-    return rows
+async def _delete_quarantine(guild_id: int, user_id: int):
+    def delete(con):
+        con.execute("DELETE FROM quarantine_bans WHERE guild_id=? AND user_id=?", (guild_id, user_id))
+        con.execute("DELETE FROM quarantine_roles WHERE guild_id=? AND user_id=?", (guild_id, user_id))
+    await db.run(delete)
+    _quarantined.discard((guild_id, user_id))
 
 
-def _delete_quarantine(guild_id: int, user_id: int):
-    con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
-    cur.execute("DELETE FROM quarantine_bans WHERE guild_id=? AND user_id=?", (guild_id, user_id))
-    con.commit()
-    con.close()
+async def _load_quarantined():
+    rows = await db.fetchall("SELECT guild_id,user_id FROM quarantine_bans")
+    _quarantined.clear()
+    _quarantined.update((int(g), int(u)) for g, u in rows)
 
 
 
-def _get_rejoin_count(guild_id: int, user_id: int) -> int:
-    con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
-    cur.execute("SELECT rejoin_count FROM rejoin_abuse WHERE guild_id=? AND user_id=?", (guild_id, user_id))
-    row = cur.fetchone()
-    con.close()
+async def _get_rejoin_count(guild_id: int, user_id: int) -> int:
+    row = await db.fetchone("SELECT rejoin_count FROM rejoin_abuse WHERE guild_id=? AND user_id=?", (guild_id, user_id))
     return int(row[0]) if row else 0
 
 
-def _inc_rejoin_count(guild_id: int, user_id: int) -> int:
+async def _inc_rejoin_count(guild_id: int, user_id: int) -> int:
     now = int(time.time())
-    con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
-    cur.execute("""INSERT INTO rejoin_abuse(guild_id,user_id,rejoin_count,last_rejoin_at)
+    await db.execute("""INSERT INTO rejoin_abuse(guild_id,user_id,rejoin_count,last_rejoin_at)
                    VALUES(?,?,1,?)
                    ON CONFLICT(guild_id,user_id) DO UPDATE SET
                         rejoin_count=rejoin_count+1,
                         last_rejoin_at=excluded.last_rejoin_at
                 """, (guild_id, user_id, now))
-    con.commit()
-    con.close()
-    return _get_rejoin_count(guild_id, user_id)
+    return await _get_rejoin_count(guild_id, user_id)
 
 
-def _clear_rejoin_count(guild_id: int, user_id: int):
-    con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
-    cur.execute("DELETE FROM rejoin_abuse WHERE guild_id=? AND user_id=?", (guild_id, user_id))
-    con.commit()
-    con.close()
+async def _clear_rejoin_count(guild_id: int, user_id: int):
+    await db.execute("DELETE FROM rejoin_abuse WHERE guild_id=? AND user_id=?", (guild_id, user_id))
 
 
 def _parse_duration(s: str) -> Optional[int]:
@@ -231,28 +177,40 @@ def _parse_duration(s: str) -> Optional[int]:
     return n * mult
 
 
-def _insert_mute(guild_id: int, user_id: int, ends_at: int, roles: List[int], reason: str, muted_by: int):
-    con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
-    cur.execute("""INSERT INTO mutes(guild_id,user_id,ends_at,roles_json,reason,muted_by)
-                   VALUES(?,?,?,?,?,?)
-                   ON CONFLICT(guild_id,user_id) DO UPDATE SET
-                        ends_at=excluded.ends_at,
-                        roles_json=excluded.roles_json,
-                        reason=excluded.reason,
-                        muted_by=excluded.muted_by
-                """,
-                (guild_id, user_id, ends_at, json.dumps(roles), reason, muted_by))
-    con.commit()
-    con.close()
+async def _insert_mute(guild_id: int, user_id: int, ends_at: int, roles: List[int], reason: str, muted_by: int):
+    def insert(con):
+        con.execute("""INSERT INTO mutes(guild_id,user_id,ends_at,reason,muted_by)
+                       VALUES(?,?,?,?,?)
+                       ON CONFLICT(guild_id,user_id) DO UPDATE SET
+                            ends_at=excluded.ends_at,
+                            reason=excluded.reason,
+                            muted_by=excluded.muted_by
+                    """,
+                    (guild_id, user_id, ends_at, reason, muted_by))
+        _replace_saved_roles(con, "mute_roles", guild_id, user_id, roles)
+    await db.run(insert)
+    scheduler.schedule("unmute", (guild_id, user_id), ends_at)
+
+
+async def _remove_mute(guild_id: int, user_id: int):
+    def delete(con):
+        con.execute("DELETE FROM mutes WHERE guild_id=? AND user_id=?", (guild_id, user_id))
+        con.execute("DELETE FROM mute_roles WHERE guild_id=? AND user_id=?", (guild_id, user_id))
+    await db.run(delete)
+
 
+async def _get_due_mute(guild_id: int, user_id: int, now_ts: int):
+    # -> (guild_id, user_id, ends_at, saved role ids) once the mute has expired
+    def get(con):
+        row = con.execute("SELECT guild_id,user_id,ends_at FROM mutes WHERE guild_id=? AND user_id=? AND ends_at<=?",
+                          (guild_id, user_id, now_ts)).fetchone()
+        return row + (_saved_roles(con, "mute_roles", guild_id, user_id),) if row else None
+    return await db.run(get)
 
-def _remove_mute(guild_id: int, user_id: int):
-    con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
-    cur.execute("DELETE FROM mutes WHERE guild_id=? AND user_id=?", (guild_id, user_id))
-    con.commit()
-    con.close()
+
+async def _mute_timers():
+    rows = await db.fetchall("SELECT ends_at,guild_id,user_id FROM mutes")
+    return [(ends_at, (guild_id, user_id)) for ends_at, guild_id, user_id in rows]
 
 
 class AppealModal(discord.ui.Modal, title="Ban Appeal"):
@@ -265,7 +223,7 @@ class AppealModal(discord.ui.Modal, title="Ban Appeal"):
         self.user_id = user_id
 
     async def on_submit(self, interaction: discord.Interaction):
-        row = _get_quarantine(self.guild_id, self.user_id)
+        row = await _get_quarantine(self.guild_id, self.user_id)
         if not row:
             return await interaction.response.send_message("Appeal record not found.", ephemeral=True)
 
@@ -284,7 +242,7 @@ class AppealModal(discord.ui.Modal, title="Ban Appeal"):
                 ephemeral=True
             )
 
-        _set_appeal_submitted(self.guild_id, self.user_id, str(self.appeal).strip())
+        await _set_appeal_submitted(self.guild_id, self.user_id, str(self.appeal).strip())
 
         guild = self.cog.bot.get_guild(self.guild_id)
         if not guild:
@@ -326,7 +284,7 @@ class AppealChannelView(discord.ui.View):
         if interaction.user.id != self.user_id:
             return await interaction.response.send_message("This button isn’t for you.", ephemeral=True)
 
-        row = _get_quarantine(self.guild_id, self.user_id)
+        row = await _get_quarantine(self.guild_id, self.user_id)
         if not row:
             return await interaction.response.send_message("Appeal record not found.", ephemeral=True)
 
@@ -351,14 +309,14 @@ class AppealStaffView(discord.ui.View):
     async def _can_use(self, interaction: discord.Interaction) -> bool:
         if not interaction.guild or not isinstance(interaction.user, discord.Member):
             return False
-        return _is_staff(interaction.user)
+        return is_staff(interaction.user)
 
     def _modlog(self, guild: discord.Guild) -> Optional[discord.TextChannel]:
         return discord.utils.get(guild.text_channels, name=MODLOG_NAME)
 
     async def _log_to_modlog(self, guild: discord.Guild, decision: str, decided_by: discord.Member):
         modlog = self._modlog(guild)
-        row = _get_quarantine(guild.id, self.user_id)
+        row = await _get_quarantine(guild.id, self.user_id)
         if not modlog or not row:
             return
 
@@ -394,7 +352,7 @@ class AppealStaffView(discord.ui.View):
             return await interaction.response.send_message("⛔ No permission.", ephemeral=True)
 
         guild = interaction.guild
-        row = _get_quarantine(guild.id, self.user_id)
+        row = await _get_quarantine(guild.id, self.user_id)
         if not row:
             return await interaction.response.send_message("Record not found.", ephemeral=True)
 
@@ -402,14 +360,14 @@ class AppealStaffView(discord.ui.View):
         if not member:
             return await interaction.response.send_message("User is no longer in the server.", ephemeral=True)
 
-        _set_decision(guild.id, self.user_id, "approved", interaction.user.id)
+        await _set_decision(guild.id, self.user_id, "approved", interaction.user.id)
 
         banned_role = discord.utils.get(guild.roles, name="Banned")
         me = guild.me
         try:
             if banned_role and banned_role in member.roles and me and banned_role < me.top_role:
                 await member.remove_roles(banned_role, reason="Appeal approved")
-            roles_to_restore = json.loads(row[2] or "[]")
+            roles_to_restore = row[2]
             roles = []
             for rid in roles_to_restore:
                 r = guild.get_role(int(rid))
@@ -432,7 +390,7 @@ class AppealStaffView(discord.ui.View):
         await self._log_to_modlog(guild, "approved", interaction.user)
         await interaction.response.send_message("✅ Approved. Roles restored; Banned role removed.", ephemeral=True)
         await self._cleanup(interaction)
-        _delete_quarantine(guild.id, self.user_id)
+        await _delete_quarantine(guild.id, self.user_id)
 
     @discord.ui.button(label="Decline", style=discord.ButtonStyle.danger)
     async def decline(self, interaction: discord.Interaction, button: discord.ui.Button):
@@ -440,7 +398,7 @@ class AppealStaffView(discord.ui.View):
             return await interaction.response.send_message("⛔ No permission.", ephemeral=True)
 
         guild = interaction.guild
-        row = _get_quarantine(guild.id, self.user_id)
+        row = await _get_quarantine(guild.id, self.user_id)
         if not row:
             return await interaction.response.send_message("Record not found.", ephemeral=True)
 
@@ -448,7 +406,7 @@ class AppealStaffView(discord.ui.View):
         if not member:
             return await interaction.response.send_message("User is no longer in the server.", ephemeral=True)
 
-        _set_decision(guild.id, self.user_id, "declined", interaction.user.id)
+        await _set_decision(guild.id, self.user_id, "declined", interaction.user.id)
 
         try:
             await member.send(embed=discord.Embed(
@@ -462,7 +420,7 @@ class AppealStaffView(discord.ui.View):
             pass
 
         execute_at = int(time.time()) + PERMABAN_DELAY_SECONDS
-        _schedule_permaban(guild.id, member.id, execute_at, row[4] or "No reason", interaction.user.id)
+        await _schedule_permaban(guild.id, member.id, execute_at, row[4] or "No reason", interaction.user.id)
 
         await self._log_to_modlog(guild, "declined", interaction.user)
         await interaction.response.send_message("✅ Declined. Permanent ban scheduled (~30s).", ephemeral=True)
@@ -472,9 +430,13 @@ class AppealStaffView(discord.ui.View):
 class ModerationSuite(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        _ensure_db()
-        self.unmute_due.start()
-        self.permaban_due.start()
+        # exact-time timers instead of polling; jobs are reloaded from their tables on start
+        scheduler.register("unmute", self._unmute_due, _mute_timers)
+        scheduler.register("permaban", self._permaban_due, _permaban_timers)
+
+    def cog_unload(self):
+        scheduler.unregister("unmute")
+        scheduler.unregister("permaban")
 
     def _modlog(self, guild: discord.Guild) -> Optional[discord.TextChannel]:
         return discord.utils.get(guild.text_channels, name=MODLOG_NAME)
@@ -494,40 +456,34 @@ class ModerationSuite(commands.Cog):
         if banned_ch is None:
             banned_ch = await guild.create_text_channel(BANNED_CHANNEL_NAME, reason="Create #banned for quarantine-ban")
 
-        # #banned hidden from everyone, visible to banned
-        try:
-            ow_every = banned_ch.overwrites_for(guild.default_role)
-            ow_every.view_channel = False
-            await banned_ch.set_permissions(guild.default_role, overwrite=ow_every, reason="Quarantine #banned perms")
-
-            ow_banned = banned_ch.overwrites_for(banned_role)
-            ow_banned.view_channel = True
-            ow_banned.send_messages = False
-            ow_banned.add_reactions = False
-            ow_banned.send_messages_in_threads = False
-            await banned_ch.set_permissions(banned_role, overwrite=ow_banned, reason="Quarantine #banned perms")
-        except Exception:
-            pass
-
-        # hide all other channels from banned
-        for ch in guild.text_channels:
-            if ch.id == banned_ch.id:
-                continue
-            try:
-                ow = ch.overwrites_for(banned_role)
-                ow.view_channel = False
-                ow.send_messages = False
-                await ch.set_permissions(banned_role, overwrite=ow, reason="Quarantine: hide channels from Banned role")
-            except Exception:
-                pass
-
+        # only channels whose overwrites differ are touched; normally this makes no REST calls
+        await reconcile(banned_plan(guild, banned_role, banned_ch), reason="Quarantine: Banned role overwrites")
         return banned_role, banned_ch
 
+    @commands.Cog.listener()
+    async def on_guild_channel_create(self, channel: discord.abc.GuildChannel):
+        # new channels get the Banned/Muted overwrites straight away
+        if not isinstance(channel, discord.TextChannel):
+            return
+        guild = channel.guild
+        me = guild.me
+        if not me or not me.guild_permissions.manage_roles:
+            return
+        plan = []
+        banned_role = discord.utils.get(guild.roles, name="Banned")
+        banned_ch = discord.utils.get(guild.text_channels, name=BANNED_CHANNEL_NAME)
+        if banned_role and banned_ch:
+            plan += banned_plan(guild, banned_role, banned_ch, [channel])
+        muted_role = discord.utils.get(guild.roles, name="Muted")
+        if muted_role:
+            plan += muted_plan(guild, muted_role, [channel])
+        await reconcile(plan, reason="New channel: Banned/Muted overwrites")
+
     @app_commands.command(name="warn", description="Warn a member (staff only). Sends them a DM.")
     async def warn(self, interaction: discord.Interaction, member: discord.Member, reason: str = "No reason provided"):
         if not interaction.guild or not isinstance(interaction.user, discord.Member):
             return await interaction.response.send_message("Server only.", ephemeral=True)
-        if not _is_staff(interaction.user):
+        if not is_staff(interaction.user):
             return await interaction.response.send_message("⛔ No permission.", ephemeral=True)
         await self._dm(member, "⚠️ You were warned",
                        f"**Server:** {interaction.guild.name}\n**By:** {interaction.user} (`{interaction.user.id}`)\n**Reason:** {reason}",
@@ -538,7 +494,7 @@ class ModerationSuite(commands.Cog):
     async def kick(self, interaction: discord.Interaction, member: discord.Member, reason: str = "No reason provided"):
         if not interaction.guild or not isinstance(interaction.user, discord.Member):
             return await interaction.response.send_message("Server only.", ephemeral=True)
-        if not _is_staff(interaction.user):
+        if not is_staff(interaction.user):
             return await interaction.response.send_message("⛔ No permission.", ephemeral=True)
         await self._dm(member, "👢 You were kicked",
                        f"**Server:** {interaction.guild.name}\n**By:** {interaction.user} (`{interaction.user.id}`)\n**Reason:** {reason}",
@@ -553,7 +509,7 @@ class ModerationSuite(commands.Cog):
     async def ban(self, interaction: discord.Interaction, member: discord.Member, reason: str = "No reason provided"):
         if not interaction.guild or not isinstance(interaction.user, discord.Member):
             return await interaction.response.send_message("Server only.", ephemeral=True)
-        if not _is_staff(interaction.user):
+        if not is_staff(interaction.user):
             return await interaction.response.send_message("⛔ No permission.", ephemeral=True)
 
         guild = interaction.guild
@@ -574,7 +530,7 @@ class ModerationSuite(commands.Cog):
             removable.append(r)
 
         role_ids = [r.id for r in removable]
-        _upsert_quarantine(guild.id, member.id, role_ids, interaction.user.id, reason)
+        await _upsert_quarantine(guild.id, member.id, role_ids, interaction.user.id, reason)
 
         try:
             if removable:
@@ -618,7 +574,7 @@ class ModerationSuite(commands.Cog):
     async def mute(self, interaction: discord.Interaction, member: discord.Member, duration: str, reason: str = "No reason provided"):
         if not interaction.guild or not isinstance(interaction.user, discord.Member):
             return await interaction.response.send_message("Server only.", ephemeral=True)
-        if not _is_staff(interaction.user):
+        if not is_staff(interaction.user):
             return await interaction.response.send_message("⛔ No permission.", ephemeral=True)
 
         seconds = _parse_duration(duration)
@@ -637,17 +593,7 @@ class ModerationSuite(commands.Cog):
             except Exception:
                 return await interaction.response.send_message("❌ I couldn't create the Muted role. Give me Manage Roles.", ephemeral=True)
 
-        try:
-            for ch in guild.text_channels:
-                ow = ch.overwrites_for(muted_role)
-                ow.send_messages = False
-                ow.add_reactions = False
-                ow.create_public_threads = False
-                ow.create_private_threads = False
-                ow.send_messages_in_threads = False
-                await ch.set_permissions(muted_role, overwrite=ow, reason="Muted role permissions")
-        except Exception:
-            pass
+        await reconcile(muted_plan(guild, muted_role), reason="Muted role permissions")
 
         removable = []
         for r in member.roles:
@@ -668,7 +614,7 @@ class ModerationSuite(commands.Cog):
         except Exception as e:
             return await interaction.response.send_message(f"❌ Mute failed: {e}", ephemeral=True)
 
-        _insert_mute(guild.id, member.id, ends_at, role_ids, reason, interaction.user.id)
+        await _insert_mute(guild.id, member.id, ends_at, role_ids, reason, interaction.user.id)
 
         await self._dm(member, "🔇 You were muted",
                        f"**Server:** {guild.name}\n**By:** {interaction.user} (`{interaction.user.id}`)\n"
@@ -692,14 +638,12 @@ class ModerationSuite(commands.Cog):
 
     @commands.Cog.listener()
     async def on_member_remove(self, member: discord.Member):
-        row = _get_quarantine(member.guild.id, member.id)
-        if row:
-            _inc_rejoin_count(member.guild.id, member.id)
+        if (member.guild.id, member.id) in _quarantined:
+            await _inc_rejoin_count(member.guild.id, member.id)
 
     @commands.Cog.listener()
     async def on_member_join(self, member: discord.Member):
-        row = _get_quarantine(member.guild.id, member.id)
-        if not row:
+        if (member.guild.id, member.id) not in _quarantined:
             return
 
         guild = member.guild
@@ -707,7 +651,7 @@ class ModerationSuite(commands.Cog):
         if not me or not me.guild_permissions.manage_roles:
             return
 
-        count = _inc_rejoin_count(guild.id, member.id)
+        count = await _inc_rejoin_count(guild.id, member.id)
         # Strip any auto-assigned roles on join (keep only @everyone; we will enforce Banned).
         try:
             banned_role_tmp = discord.utils.get(guild.roles, name="Banned")
@@ -732,8 +676,8 @@ class ModerationSuite(commands.Cog):
                 await guild.ban(member, reason="Quarantine evasion: left/rejoined 3+ times", delete_message_days=0)
             except Exception:
                 pass
-            _delete_quarantine(guild.id, member.id)
-            _clear_rejoin_count(guild.id, member.id)
+            await _delete_quarantine(guild.id, member.id)
+            await _clear_rejoin_count(guild.id, member.id)
 
             modlog = self._modlog(guild)
             if modlog:
@@ -752,6 +696,9 @@ class ModerationSuite(commands.Cog):
         except Exception:
             pass
 
+        guard = self.bot.get_cog("RaidGuard")
+        if guard and guard.in_raid_mode(guild.id):
+            return  # raid mode: roles are enforced above, skip the DM
         try:
             await member.send(embed=discord.Embed(
                 title="⚠️ You are still quarantined",
@@ -764,85 +711,72 @@ class ModerationSuite(commands.Cog):
         except Exception:
             pass
 
-    @tasks.loop(seconds=30)
-    async def unmute_due(self):
-        now_ts = int(time.time())
-        con = sqlite3.connect(DB_PATH)
-        cur = con.cursor()
-        cur.execute("SELECT guild_id,user_id,ends_at,roles_json FROM mutes WHERE ends_at<=?", (now_ts,))
-        due = cur.fetchall()
-        con.close()
-
-        for guild_id, user_id, ends_at, roles_json in due:
-            guild = self.bot.get_guild(int(guild_id))
-            if not guild:
-                _remove_mute(int(guild_id), int(user_id))
-                continue
-            member = guild.get_member(int(user_id))
-            if not member:
-                _remove_mute(int(guild_id), int(user_id))
-                continue
-
-            me = guild.me
-            muted_role = discord.utils.get(guild.roles, name="Muted")
-
-            try:
-                if muted_role and muted_role in member.roles and me and muted_role < me.top_role:
-                    await member.remove_roles(muted_role, reason="Mute expired")
-                role_ids = json.loads(roles_json or "[]")
-                roles_to_add = []
-                for rid in role_ids:
-                    r = guild.get_role(int(rid))
-                    if r and me and r < me.top_role:
-                        roles_to_add.append(r)
-                if roles_to_add:
-                    await member.add_roles(*roles_to_add, reason="Mute expired: restore roles")
-            except Exception:
-                pass
+    async def _unmute_due(self, key: Tuple[int, int]):
+        row = await _get_due_mute(key[0], key[1], int(time.time()))
+        if not row:
+            return  # re-muted with a later end, or already removed
+        guild_id, user_id, ends_at, role_ids = row
+        guild = self.bot.get_guild(int(guild_id))
+        if not guild:
+            await _remove_mute(int(guild_id), int(user_id))
+            return
+        member = guild.get_member(int(user_id))
+        if not member:
+            await _remove_mute(int(guild_id), int(user_id))
+            return
 
-            await self._dm(member, "🔊 You were unmuted", f"Your mute in **{guild.name}** has expired.", BRAND_GREEN)
-            modlog = self._modlog(guild)
-            if modlog:
-                await modlog.send(embed=discord.Embed(title="🔊 Member unmuted", description=f"**Member:** {member} (`{member.id}`)\n**Reason:** Mute expired", colour=BRAND_GREEN))
+        me = guild.me
+        muted_role = discord.utils.get(guild.roles, name="Muted")
 
-            _remove_mute(int(guild_id), int(user_id))
+        try:
+            if muted_role and muted_role in member.roles and me and muted_role < me.top_role:
+                await member.remove_roles(muted_role, reason="Mute expired")
+            roles_to_add = []
+            for rid in role_ids:
+                r = guild.get_role(int(rid))
+                if r and me and r < me.top_role:
+                    roles_to_add.append(r)
+            if roles_to_add:
+                await member.add_roles(*roles_to_add, reason="Mute expired: restore roles")
+        except Exception:
+            pass
 
-    @tasks.loop(seconds=15)
-    async def permaban_due(self):
-        now_ts = int(time.time())
-        due = _pop_due_permabans(now_ts)
-        for guild_id, user_id, execute_at, reason, banned_by in due:
-            guild = self.bot.get_guild(int(guild_id))
-            if not guild:
-                continue
-            member = guild.get_member(int(user_id))
-            if not member:
-                continue
-            try:
-                await guild.ban(member, reason=f"Appeal declined — permanent ban (by {banned_by}). Original: {reason}", delete_message_days=0)
-            except Exception:
-                pass
-            _delete_quarantine(int(guild_id), int(user_id))
-            modlog = self._modlog(guild)
-            if modlog:
-                embed = discord.Embed(
-                    title="🔨 Permanent ban executed",
-                    colour=discord.Colour.red(),
-                    description=f"**User:** {member} (`{member.id}`)\n"
-                                f"**Reason:** Appeal declined; permanent ban executed.\n"
-                                f"**Original reason:** {reason}"
-                )
-                await modlog.send(embed=embed)
+        await self._dm(member, "🔊 You were unmuted", f"Your mute in **{guild.name}** has expired.", BRAND_GREEN)
+        modlog = self._modlog(guild)
+        if modlog:
+            await modlog.send(embed=discord.Embed(title="🔊 Member unmuted", description=f"**Member:** {member} (`{member.id}`)\n**Reason:** Mute expired", colour=BRAND_GREEN))
 
-    @unmute_due.before_loop
-    async def _before_unmute(self):
-        await self.bot.wait_until_ready()
+        await _remove_mute(int(guild_id), int(user_id))
 
-    @permaban_due.before_loop
-    async def _before_permaban(self):
-        await self.bot.wait_until_ready()
+    async def _permaban_due(self, key: Tuple[int, int]):
+        row = await _pop_due_permaban(key[0], key[1], int(time.time()))
+        if not row:
+            return
+        guild_id, user_id, execute_at, reason, banned_by = row
+        guild = self.bot.get_guild(int(guild_id))
+        if not guild:
+            return
+        member = guild.get_member(int(user_id))
+        if not member:
+            return
+        try:
+            await guild.ban(member, reason=f"Appeal declined — permanent ban (by {banned_by}). Original: {reason}", delete_message_days=0)
+        except Exception:
+            pass
+        await _delete_quarantine(int(guild_id), int(user_id))
+        modlog = self._modlog(guild)
+        if modlog:
+            embed = discord.Embed(
+                title="🔨 Permanent ban executed",
+                colour=discord.Colour.red(),
+                description=f"**User:** {member} (`{member.id}`)\n"
+                            f"**Reason:** Appeal declined; permanent ban executed.\n"
+                            f"**Original reason:** {reason}"
+            )
+            await modlog.send(embed=embed)
 
 
 async def setup(bot: commands.Bot):
-    _ensure_db()
+    await db.run(migrate_bot_db)
+    await _load_quarantined()
     await bot.add_cog(ModerationSuite(bot))
@@ -0,0 +1,100 @@
+import os
+import asyncio
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+import discord
+
+# Streamed SHA-256 of attachments, checked against a local blocklist file.
+
+BLOCKLIST_PATH = os.path.join("data", "attachment_blocklist.txt")
+CHUNK_BYTES = 256 * 1024
+HASH_WORKERS = 2
+MAX_CONCURRENT_SCANS = 4
+DIGEST_CACHE_SIZE = 4096
+DOWNLOAD_TIMEOUT_SECONDS = 30
+
+
+def load_blocklist(path: str) -> set[str]:
+    # one hex SHA-256 per line; anything after '#' is a comment
+    out = set()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                h = line.split("#", 1)[0].strip().lower()
+                if len(h) == 64:
+                    out.add(h)
+    except FileNotFoundError:
+        pass
+    return out
+
+
+class AttachmentScanner:
+    def __init__(self, blocklist_path: str = BLOCKLIST_PATH, max_bytes: int = 25 * 1024 * 1024):
+        self.blocklist_path = blocklist_path
+        self.max_bytes = max_bytes
+        self._blocklist = set()
+        self._mtime = None
+        self._digests = OrderedDict()  # (attachment_id, size) -> sha256 hex
+        self._pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="attach-hash")
+        self._sem = asyncio.Semaphore(MAX_CONCURRENT_SCANS)
+        self.scanned = 0
+        self.cache_hits = 0
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def blocklist(self) -> set[str]:
+        # reloaded only when the file changes on disk
+        try:
+            mtime = os.stat(self.blocklist_path).st_mtime
+        except OSError:
+            mtime = None
+        if mtime != self._mtime:
+            self._mtime = mtime
+            self._blocklist = load_blocklist(self.blocklist_path)
+        return self._blocklist
+
+    async def digest(self, attachment: discord.Attachment) -> str | None:
+        key = (attachment.id, attachment.size)
+        cached = self._digests.get(key)
+        if cached is not None:
+            self._digests.move_to_end(key)
+            self.cache_hits += 1
+            return cached
+        if attachment.size > self.max_bytes:
+            return None
+
+        loop = asyncio.get_running_loop()
+        h = hashlib.sha256()
+        async with self._sem:
+            try:
+                timeout = aiohttp.ClientTimeout(total=DOWNLOAD_TIMEOUT_SECONDS)
+                async with aiohttp.ClientSession(timeout=timeout) as s:
+                    async with s.get(attachment.url) as r:
+                        if r.status != 200:
+                            return None
+                        async for chunk in r.content.iter_chunked(CHUNK_BYTES):
+                            # hashlib drops the GIL on large buffers, so the pool keeps hashing off the loop
+                            await loop.run_in_executor(self._pool, h.update, chunk)
+            except Exception:
+                return None
+
+        hexdigest = h.hexdigest()
+        self.scanned += 1
+        self._digests[key] = hexdigest
+        if len(self._digests) > DIGEST_CACHE_SIZE:
+            self._digests.popitem(last=False)
+        return hexdigest
+
+    async def find_blocked(self, attachments: list[discord.Attachment]) -> tuple[discord.Attachment, str] | None:
+        blocked = self.blocklist()
+        if not blocked:
+            return None
+        for att in attachments:
+            hexdigest = await self.digest(att)
+            if hexdigest and hexdigest in blocked:
+                return att, hexdigest
+        return None
@@ -1,13 +1,101 @@
+import io
+import gzip
+import time
+import asyncio
+import datetime
+from collections import Counter, OrderedDict, deque
+
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
+
+from cogs.message_store import MessageStore, MessageRecord, record_from_message
 
 BRAND_GREEN = discord.Colour.from_rgb(46, 204, 113)
 
 MODLOG_NAME = "mod-log"
 
+AUDIT_TTL_SECONDS = 15  # how long a gateway audit entry can still be matched to its event
+AUDIT_WAIT_SECONDS = 2.0  # how long an event waits for its audit entry (it may arrive second)
+BULK_SUPPRESS_SECONDS = 60  # ids from a bulk delete are ignored by the per-message path for this long
+
+
+class AuditIndex:
+    # Audit-log entries pushed by the gateway, keyed by (guild_id, action, target_id).
+    # Events look up their executor here instead of fetching guild.audit_logs().
+    def __init__(self, ttl: float = AUDIT_TTL_SECONDS):
+        self.ttl = ttl
+        self._entries = {}  # key -> (expires_at, executor, reason)
+        self._expiry = deque()  # (expires_at, key) in insertion order; ttl is fixed so this stays sorted
+        self._waiters = {}  # key -> [Future]
+
+    def _evict(self, now: float):
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, key = self._expiry.popleft()
+            item = self._entries.get(key)
+            if item and item[0] == expires_at:
+                del self._entries[key]
+
+    def add(self, guild_id: int, action, target_id: int, executor, reason: str | None):
+        now = time.monotonic()
+        self._evict(now)
+        key = (guild_id, action, target_id)
+        expires_at = now + self.ttl
+        self._entries[key] = (expires_at, executor, reason)
+        self._expiry.append((expires_at, key))
+        for fut in self._waiters.pop(key, []):
+            if not fut.done():
+                fut.set_result((executor, reason))
+
+    def get(self, guild_id: int, action, target_id: int):
+        self._evict(time.monotonic())
+        item = self._entries.get((guild_id, action, target_id))
+        return (item[1], item[2]) if item else (None, None)
+
+    async def wait(self, guild_id: int, action, target_id: int, timeout: float = AUDIT_WAIT_SECONDS):
+        found = self.get(guild_id, action, target_id)
+        if found[0] is not None:
+            return found
+        key = (guild_id, action, target_id)
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(key, []).append(fut)
+        try:
+            return await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            return None, None
+        finally:
+            waiting = self._waiters.get(key)
+            if waiting and fut in waiting:
+                waiting.remove(fut)
+                if not waiting:
+                    del self._waiters[key]
+
+
 class AuditLogAdvanced(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.audit = AuditIndex()
+        self._bulk_ids = OrderedDict()  # message_id -> expires_at
+        cfg = self._store_cfg()
+        self.store = MessageStore(
+            budget_bytes=int(float(cfg.get("budget_mb", 16)) * 1024 * 1024),
+            spill=bool(cfg.get("spill", True)),
+            spill_days=int(cfg.get("spill_days", 14)),
+        )
+        self.flush_store.start()
+
+    async def cog_load(self):
+        await self.store.open()
+
+    async def cog_unload(self):
+        self.flush_store.cancel()
+        await self.store.flush()
+
+    def _store_cfg(self):
+        return ((getattr(self.bot, "xcfg", {}) or {}).get("audit_log", {}) or {}).get("message_store", {}) or {}
+
+    @tasks.loop(seconds=60)
+    async def flush_store(self):
+        await self.store.flush()
 
     def _modlog_channel(self, guild: discord.Guild) -> discord.TextChannel | None:
         name = (self.bot.xcfg.get("channels", {}) or {}).get("mod_log_channel_name", MODLOG_NAME)
@@ -29,58 +117,147 @@ class AuditLogAdvanced(commands.Cog):
         except Exception:
             pass
 
-    async def _find_executor(self, guild: discord.Guild, action: discord.AuditLogAction, target_id: int | None = None):
-        try:
-            async for entry in guild.audit_logs(limit=6, action=action):
-                if target_id is None:
-                    return entry.user, entry.reason
-                t = entry.target
-                if hasattr(t, "id") and t.id == target_id:
-                    return entry.user, entry.reason
-        except Exception:
-            return None, None
-        return None, None
+    async def _find_executor(self, guild: discord.Guild, action: discord.AuditLogAction, target_id: int):
+        # zero REST calls: wait briefly for the matching on_audit_log_entry_create
+        return await self.audit.wait(guild.id, action, target_id)
+
+    @commands.Cog.listener()
+    async def on_audit_log_entry_create(self, entry: discord.AuditLogEntry):
+        target_id = getattr(entry.target, "id", None)
+        if target_id is None:
+            return
+        executor = entry.user or f"ID {entry.user_id}"
+        self.audit.add(entry.guild.id, entry.action, target_id, executor, entry.reason)
+
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        if message.guild and not message.author.bot:
+            self.store.put(record_from_message(message))
 
     @commands.Cog.listener()
-    async def on_message_delete(self, message: discord.Message):
-        if not message.guild or message.author.bot:
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        if not payload.guild_id or self._in_bulk(payload.message_id):
+            return
+        guild = self.bot.get_guild(payload.guild_id)
+        rec = await self.store.pop(payload.message_id)
+        if rec is None and payload.cached_message and not payload.cached_message.author.bot:
+            rec = record_from_message(payload.cached_message)
+        if guild is None or rec is None:
             return
         embed = discord.Embed(
             title="🗑️ Message deleted",
             colour=BRAND_GREEN,
-            description=f"**Author:** {message.author} (ID {message.author.id})\n"
-                        f"**Channel:** {message.channel.mention}"
+            description=f"**Author:** {rec.author_name} (ID {rec.author_id})\n"
+                        f"**Channel:** <#{rec.channel_id}>"
         )
-        content = (message.content or "").strip()
+        content = rec.content.strip()
         if content:
             embed.add_field(name="Content", value=content[:1024], inline=False)
-        if message.attachments:
-            att_lines = [f"[{a.filename}]({a.url})" for a in message.attachments[:10]]
+        if rec.attachments:
+            att_lines = [f"[{name}]({url})" for name, url in rec.attachments]
             embed.add_field(name="Attachments", value="\n".join(att_lines), inline=False)
 
-        executor, reason = await self._find_executor(message.guild, discord.AuditLogAction.message_delete)
+        executor, reason = await self._find_executor(guild, discord.AuditLogAction.message_delete, rec.author_id)
         if executor:
             embed.set_footer(text=f"Deleted by: {executor} • Reason: {reason or '—'}")
-        await self._send(message.guild, embed)
+        await self._send(guild, embed)
+
+    def _in_bulk(self, message_id: int) -> bool:
+        now = time.monotonic()
+        while self._bulk_ids:
+            mid, expires_at = next(iter(self._bulk_ids.items()))
+            if expires_at > now:
+                break
+            del self._bulk_ids[mid]
+        return message_id in self._bulk_ids
 
     @commands.Cog.listener()
-    async def on_message_edit(self, before: discord.Message, after: discord.Message):
-        if not after.guild or after.author.bot:
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent):
+        # one summary + gzipped transcript instead of one embed per message
+        if not payload.guild_id:
             return
-        if (before.content or "") == (after.content or ""):
+        expires_at = time.monotonic() + BULK_SUPPRESS_SECONDS
+        for mid in payload.message_ids:
+            self._bulk_ids[mid] = expires_at
+        guild = self.bot.get_guild(payload.guild_id)
+        if guild is None:
+            return
+
+        cached = {m.id: m for m in payload.cached_messages}
+        records = []
+        for mid in sorted(payload.message_ids):
+            rec = await self.store.pop(mid)
+            if rec is None and mid in cached and not cached[mid].author.bot:
+                rec = record_from_message(cached[mid])
+            if rec is not None:
+                records.append(rec)
+
+        lines = []
+        for rec in records:
+            ts = discord.utils.snowflake_time(rec.message_id).strftime("%Y-%m-%d %H:%M:%S")
+            line = f"[{ts}] {rec.author_name} ({rec.author_id}): {rec.content}"
+            if rec.attachments:
+                line += " | " + " ".join(url for _name, url in rec.attachments)
+            lines.append(line)
+        unknown = len(payload.message_ids) - len(records)
+        if unknown:
+            lines.append(f"-- {unknown} message(s) not in the store (bots or too old) --")
+
+        embed = discord.Embed(
+            title="🧹 Bulk delete",
+            colour=BRAND_GREEN,
+            description=f"**{len(payload.message_ids)}** messages deleted in <#{payload.channel_id}>"
+        )
+        top = Counter(rec.author_name for rec in records).most_common(5)
+        if top:
+            embed.add_field(name="Authors", value="\n".join(f"{name}: {n}" for name, n in top)[:1024], inline=False)
+        executor, reason = await self._find_executor(guild, discord.AuditLogAction.message_bulk_delete, payload.channel_id)
+        if executor:
+            embed.set_footer(text=f"Deleted by: {executor} • Reason: {reason or '—'}")
+
+        ch = self._modlog_channel(guild)
+        if not ch:
+            return
+        stamp = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%d-%H%M%S")
+        blob = gzip.compress("\n".join(lines).encode("utf-8"))
+        try:
+            await ch.send(embed=embed, file=discord.File(io.BytesIO(blob), filename=f"bulk-delete-{payload.channel_id}-{stamp}.txt.gz"))
+        except Exception:
+            pass
+
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        data = payload.data or {}
+        if not payload.guild_id or "content" not in data or (data.get("author") or {}).get("bot"):
+            return
+        guild = self.bot.get_guild(payload.guild_id)
+        if guild is None:
+            return
+        after = data.get("content") or ""
+        before = await self.store.update_content(payload.message_id, after)
+        if before is None and payload.cached_message and not payload.cached_message.author.bot:
+            before = record_from_message(payload.cached_message)
+        if before is None:
+            # never seen before: nothing to diff against, but remember it for the next edit/delete
+            author = data.get("author") or {}
+            if author.get("id"):
+                self.store.put(MessageRecord(payload.message_id, payload.guild_id, payload.channel_id, int(author["id"]),
+                                             author.get("global_name") or author.get("username") or "unknown", after, ()))
+            return
+        if before.content == after:
             return
         embed = discord.Embed(
             title="✏️ Message edited",
             colour=BRAND_GREEN,
-            description=f"**Author:** {after.author} (ID {after.author.id})\n"
-                        f"**Channel:** {after.channel.mention}\n"
-                        f"[Jump to message]({after.jump_url})"
+            description=f"**Author:** {before.author_name} (ID {before.author_id})\n"
+                        f"**Channel:** <#{before.channel_id}>\n"
+                        f"[Jump to message]({before.jump_url})"
         )
         if before.content:
             embed.add_field(name="Before", value=before.content[:1024], inline=False)
-        if after.content:
-            embed.add_field(name="After", value=after.content[:1024], inline=False)
-        await self._send(after.guild, embed)
+        if after:
+            embed.add_field(name="After", value=after[:1024], inline=False)
+        await self._send(guild, embed)
 
     @commands.Cog.listener()
     async def on_member_update(self, before: discord.Member, after: discord.Member):
@@ -127,7 +304,7 @@ class AuditLogAdvanced(commands.Cog):
     async def on_guild_channel_create(self, channel: discord.abc.GuildChannel):
         guild = channel.guild
         embed = discord.Embed(title="📁 Channel created", colour=BRAND_GREEN, description=f"{channel.mention} (`{channel.name}`)")
-        executor, reason = await self._find_executor(guild, discord.AuditLogAction.channel_create)
+        executor, reason = await self._find_executor(guild, discord.AuditLogAction.channel_create, channel.id)
         if executor:
             embed.set_footer(text=f"By: {executor} • Reason: {reason or '—'}")
         await self._send(guild, embed)
@@ -136,7 +313,7 @@ class AuditLogAdvanced(commands.Cog):
     async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
         guild = channel.guild
         embed = discord.Embed(title="🗑️ Channel deleted", colour=BRAND_GREEN, description=f"`{channel.name}` (ID {channel.id})")
-        executor, reason = await self._find_executor(guild, discord.AuditLogAction.channel_delete)
+        executor, reason = await self._find_executor(guild, discord.AuditLogAction.channel_delete, channel.id)
         if executor:
             embed.set_footer(text=f"By: {executor} • Reason: {reason or '—'}")
         await self._send(guild, embed)
@@ -151,7 +328,7 @@ class AuditLogAdvanced(commands.Cog):
             colour=BRAND_GREEN,
             description=f"**Before:** `{before.name}`\n**After:** `{after.name}`"
         )
-        executor, reason = await self._find_executor(guild, discord.AuditLogAction.channel_update)
+        executor, reason = await self._find_executor(guild, discord.AuditLogAction.channel_update, after.id)
         if executor:
             embed.set_footer(text=f"By: {executor} • Reason: {reason or '—'}")
         await self._send(guild, embed)
@@ -1,20 +1,418 @@
 import re
 import time
+import hashlib
+import datetime
+import unicodedata
+from collections import OrderedDict, deque
 import discord
-from discord.ext import commands
+from discord import app_commands
+from discord.ext import commands, tasks
+
+from cogs.message_features import features_for
+from cogs.link_reputation import LinkAnalyzer, extract_urls, host_of, DENY
+from cogs.attachment_scan import AttachmentScanner, BLOCKLIST_PATH
+from cogs.permissions import is_admin, is_automod_exempt
+
+INVITE_PATTERN = r"discord\.gg/|discord(?:app)?\.com/invite/"
+INVITE_RE = re.compile(INVITE_PATTERN, re.IGNORECASE)
+
+# Cyrillic/Greek/other lookalikes folded to ASCII before scanning (NFKC already folds fullwidth forms).
+CONFUSABLES = {
+    "а": "a", "е": "e", "о": "o", "р": "p", "с": "c", "у": "y", "х": "x", "і": "i", "ј": "j", "ѕ": "s",
+    "ԁ": "d", "ɡ": "g", "һ": "h", "ӏ": "l", "ԛ": "q", "ԝ": "w", "ү": "y", "к": "k", "м": "m", "т": "t",
+    "в": "b", "н": "h", "α": "a", "β": "b", "ε": "e", "ι": "i", "κ": "k", "ν": "v", "ο": "o", "ρ": "p",
+    "τ": "t", "υ": "u", "χ": "x", "ω": "w", "ℓ": "l", "ı": "i",
+}
+ZERO_WIDTH = dict.fromkeys(map(ord, "\u200b\u200c\u200d\u2060\ufeff\u00ad"))
+FOLD_TABLE = {**str.maketrans(CONFUSABLES), **ZERO_WIDTH}
+
+# Leetspeak digits/symbols are matched by widening each letter of a blocked word, not by rewriting the text.
+LEET = {"a": "a4@", "b": "b8", "e": "e3", "g": "g9", "i": "i1!|l", "l": "l1|i", "o": "o0", "s": "s5$", "t": "t7+", "z": "z2"}
+
+
+def fold_text(text: str) -> str:
+    # NFKD + drop combining marks, then casefold and map confusables in one translate pass
+    if text.isascii():
+        return text.lower()
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return unicodedata.normalize("NFKC", text).casefold().translate(FOLD_TABLE)
+
+
+def _char_class(ch: str) -> str:
+    alts = LEET.get(ch)
+    if not alts:
+        return re.escape(ch)
+    return "[" + "".join(re.escape(c) for c in alts) + "]"
+
+
+def _trie_pattern(words: list[str]) -> str:
+    # Shared prefixes are merged (a|ab|abc -> a(?:b(?:c)?)?) so the alternation never re-scans a prefix.
+    trie = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def _build(node) -> str:
+        end = "" in node
+        branches = [_char_class(ch) + _build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if end:
+            return "(?:" + body + ")?"
+        return body
+
+    return _build(trie)
+
+
+class FilterEngine:
+    # All content rules compiled into one regex over the folded text; one scan per message.
+    def __init__(self, cfg: dict, skip_invites: bool = False):
+        parts = []
+        invites = cfg.get("block_invite_links", True) and not skip_invites
+        if invites:
+            parts.append(f"(?P<invite>{INVITE_PATTERN})")
+        words = sorted({fold_text(str(w)).strip() for w in (cfg.get("blocked_words") or []) if str(w).strip()})
+        if words:
+            parts.append(rf"(?P<word>(?<!\w){_trie_pattern(words)}(?!\w))")
+        patterns = [str(p) for p in (cfg.get("blocked_patterns") or []) if str(p).strip()]
+        valid = []
+        for pat in patterns:
+            # test it the way it is used: wrapped and joined with everything accepted so far, which
+            # rejects mid-pattern global flags like (?i) and group names clashing with other rules
+            candidate = valid + [f"(?:{pat})"]
+            try:
+                re.compile("|".join(parts + [f"(?P<pattern>{'|'.join(candidate)})"]), re.IGNORECASE)
+                valid = candidate
+            except (re.error, RecursionError, OverflowError):
+                pass
+        base = list(parts)
+        if valid:
+            parts.append(f"(?P<pattern>{'|'.join(valid)})")
+        self.rule_count = (1 if invites else 0) + len(words) + len(valid)
+        self.regex = None
+        for attempt in (parts, base):
+            if not attempt:
+                break
+            try:
+                self.regex = re.compile("|".join(attempt), re.IGNORECASE)
+                break
+            except (re.error, RecursionError, OverflowError):
+                # custom patterns dropped; a broken config must never make on_message raise
+                self.rule_count -= len(valid)
+                valid = []
+
+    def scan(self, content: str) -> tuple[str, str] | None:
+        if self.regex is None or not content:
+            return None
+        m = self.regex.search(fold_text(content))
+        if not m:
+            return None
+        return m.lastgroup, m.group(0)
+
+URL_RE = re.compile(r"https?://\S+")
+WORD_RE = re.compile(r"\w+")
+SIMHASH_BANDS = 8  # 8 x 8-bit bands: any pair within 7 bits shares at least one band exactly
+WAVE_MAX_CLUSTERS = 2000  # per guild
+WAVE_MAX_REFS = 50  # message refs kept per cluster for cleanup
+
+NATIVE_RULE_PREFIX = "XonarousLIVE"  # native AutoMod rules we own are named "<prefix> · <feature>"
+NATIVE_MAX_KEYWORDS = 1000
+NATIVE_MAX_REGEX = 10
+
+
+def _h64(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def simhash(tokens: list[str]) -> int:
+    weights = [0] * 64
+    for tok in tokens:
+        h = _h64(tok)
+        for bit in range(64):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+    out = 0
+    for bit, w in enumerate(weights):
+        if w > 0:
+            out |= 1 << bit
+    return out
+
+
+class WaveCluster:
+    __slots__ = ("fingerprint", "simhash", "users", "young", "signals", "refs", "first_seen", "last_seen",
+                 "actioned", "logged")
+
+    def __init__(self, fingerprint: str, sh: int, now: float):
+        self.fingerprint = fingerprint
+        self.simhash = sh
+        self.users = set()
+        self.young = set()  # posters whose account is younger than wave_young_account_days
+        self.signals = set()  # scam signals seen in any copy: "link", "invite", "mention"
+        self.refs = deque(maxlen=WAVE_MAX_REFS)  # (channel_id, message_id, user_id)
+        self.first_seen = now
+        self.last_seen = now
+        self.actioned = False
+        self.logged = False  # reported to the mod log without action
+
+
+class WaveDetector:
+    # Guild-wide index of recent message fingerprints: exact hash lookup plus simhash bands for near-duplicates.
+    def __init__(self, window: float, max_clusters: int = WAVE_MAX_CLUSTERS, max_distance: int = SIMHASH_BANDS - 1):
+        self.window = window
+        self.max_clusters = max_clusters
+        self.max_distance = max_distance
+        self._clusters = OrderedDict()  # fingerprint -> WaveCluster, least recently seen first
+        self._bands = {}  # (band index, band value) -> fingerprint
+
+    def __len__(self):
+        return len(self._clusters)
+
+    @staticmethod
+    def _bands_of(sh: int):
+        width = 64 // SIMHASH_BANDS
+        mask = (1 << width) - 1
+        return [(i, (sh >> (width * i)) & mask) for i in range(SIMHASH_BANDS)]
+
+    def _drop(self, cluster: WaveCluster):
+        self._clusters.pop(cluster.fingerprint, None)
+        for band in self._bands_of(cluster.simhash):
+            if self._bands.get(band) == cluster.fingerprint:
+                del self._bands[band]
+
+    def expire(self, now: float):
+        while self._clusters:
+            oldest = next(iter(self._clusters.values()))
+            if now - oldest.last_seen <= self.window and len(self._clusters) <= self.max_clusters:
+                break
+            self._drop(oldest)
+
+    def _find(self, fingerprint: str, sh: int) -> WaveCluster | None:
+        cluster = self._clusters.get(fingerprint)
+        if cluster is not None:
+            return cluster
+        for band in self._bands_of(sh):
+            fp = self._bands.get(band)
+            if fp is None:
+                continue
+            cand = self._clusters.get(fp)
+            if cand is not None and bin(cand.simhash ^ sh).count("1") <= self.max_distance:
+                return cand
+        return None
+
+    def add(self, text: str, channel_id: int, message_id: int, user_id: int, now: float,
+            min_length: int = 0) -> WaveCluster | None:
+        # -> None when the text part is too short to compare (bare links, GIFs, emoji)
+        folded = fold_text(text)
+        norm = " ".join(WORD_RE.findall(URL_RE.sub(" ", folded)))
+        if not norm or len(norm) < min_length:
+            return None
+        # links are part of the identity: same text with different links is not the same message
+        urls = sorted({u.rstrip(".,!?)>").split("://", 1)[-1].lower() for u in URL_RE.findall(folded)})
+        fingerprint = hashlib.blake2b("\n".join([norm] + urls).encode("utf-8"), digest_size=8).hexdigest()
+        tokens = norm.split()
+        # unigrams + bigrams: short scam texts stay within a few bits after small edits
+        sh = simhash(tokens + [" ".join(tokens[i:i + 2]) for i in range(len(tokens) - 1)] + urls)
+        self.expire(now)
+        cluster = self._find(fingerprint, sh)
+        if cluster is None:
+            cluster = WaveCluster(fingerprint, sh, now)
+            self._clusters[fingerprint] = cluster
+            for band in self._bands_of(sh):
+                self._bands[band] = fingerprint
+        else:
+            self._clusters.move_to_end(cluster.fingerprint)
+        cluster.last_seen = now
+        cluster.users.add(user_id)
+        cluster.refs.append((channel_id, message_id, user_id))
+        self.expire(now)
+        return cluster
 
-INVITE_RE = re.compile(r"(discord\.gg/|discord\.com/invite/)", re.IGNORECASE)
 
 class AutoMod(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self._recent = {}  # (guild_id, user_id) -> [timestamps]
+        self._recent = {}  # (guild_id, user_id) -> deque of (ts, channel_id, message_id), maxlen = spam_max_messages
+        self._engine_src = None  # automod config the filter engines were built from
+        self._engines = {}  # skip_invites -> FilterEngine
+        self._links = None  # LinkAnalyzer, rebuilt with the filter engines
+        self._scanner = None  # AttachmentScanner, created on first use
+        self._native = {}  # guild_id -> features enforced by Discord's native AutoMod ("invite", "mentions")
+        self._waves = {}  # guild_id -> WaveDetector
+        self.sweep_recent.start()
+
+    def cog_unload(self):
+        self.sweep_recent.cancel()
+        if self._scanner is not None:
+            self._scanner.close()
 
     def _cfg(self):
         return (getattr(self.bot, "xcfg", {}) or {}).get("automod", {}) or {}
 
-    def _is_mod(self, m: discord.Member) -> bool:
-        return m.guild_permissions.administrator or m.guild_permissions.manage_messages or any(r.name == "Discord Moderator" for r in m.roles)
+    def _filter(self, skip_invites: bool = False) -> FilterEngine:
+        cfg = self._cfg()
+        if cfg is not self._engine_src:
+            self._engine_src = cfg
+            self._engines.clear()
+            self._links = None
+        engine = self._engines.get(skip_invites)
+        if engine is None:
+            engine = self._engines[skip_invites] = FilterEngine(cfg, skip_invites=skip_invites)
+        return engine
+
+    def _link_analyzer(self) -> LinkAnalyzer:
+        self._filter()  # drops the analyzer if the config was reloaded
+        if self._links is None:
+            self._links = LinkAnalyzer(self._cfg())
+        return self._links
+
+    async def _check_expanded(self, message: discord.Message, urls: list[str]):
+        # runs off the on_message path: expand unknown short links, then act if one lands on a blocked domain
+        links = self._link_analyzer()
+        for url in urls:
+            final = await links.expand(url)
+            if not final:
+                continue
+            host = host_of(final)
+            if links.verdict(host) == DENY:
+                await self._take_action(message, reason=f"blocked link ({host} via short link)")
+                return
+
+    async def _scan_attachments(self, message: discord.Message):
+        cfg = self._cfg()
+        if self._scanner is None:
+            self._scanner = AttachmentScanner(
+                cfg.get("attachment_blocklist_path", BLOCKLIST_PATH),
+                max_bytes=int(float(cfg.get("attachment_max_mb", 25)) * 1024 * 1024),
+            )
+        hit = await self._scanner.find_blocked(message.attachments)
+        if hit:
+            att, hexdigest = hit
+            await self._take_action(message, reason=f"blocked attachment ({att.filename}, sha256 {hexdigest[:12]}…)")
+
+    def _native_rules(self, guild: discord.Guild) -> dict:
+        # feature -> desired rule kwargs, derived from the automod config block
+        cfg = self._cfg()
+        minutes = int(cfg.get("action_timeout_minutes", 10))
+        ch_name = (self.bot.xcfg.get("channels", {}) or {}).get("mod_log_channel_name", "mod-log")
+        modlog = discord.utils.get(guild.text_channels, name=ch_name)
+
+        def _actions(message: str, timeout: bool = False):
+            acts = [discord.AutoModRuleAction(custom_message=message)]
+            if modlog:
+                acts.append(discord.AutoModRuleAction(channel_id=modlog.id))
+            if timeout and minutes > 0:
+                acts.append(discord.AutoModRuleAction(duration=datetime.timedelta(minutes=min(minutes, 40320))))
+            return acts
+
+        exempt = [r for r in guild.roles if r.name == "Discord Moderator"][:20]
+        rules = {}
+        if cfg.get("block_invite_links", True):
+            rules["invite"] = dict(
+                trigger=discord.AutoModTrigger(type=discord.AutoModRuleTriggerType.keyword, regex_patterns=[INVITE_PATTERN]),
+                actions=_actions("Invite links are not allowed here."),
+                exempt_roles=exempt,
+            )
+        rules["mentions"] = dict(
+            trigger=discord.AutoModTrigger(type=discord.AutoModRuleTriggerType.mention_spam,
+                                           mention_limit=min(50, max(1, int(cfg.get("max_mentions", 6)) - 1))),
+            actions=_actions("Too many mentions.", timeout=True),
+            exempt_roles=exempt,
+        )
+        words = [str(w).strip() for w in (cfg.get("blocked_words") or []) if str(w).strip()][:NATIVE_MAX_KEYWORDS]
+        patterns = [str(p) for p in (cfg.get("blocked_patterns") or []) if str(p).strip()][:NATIVE_MAX_REGEX]
+        if words or patterns:
+            rules["words"] = dict(
+                trigger=discord.AutoModTrigger(type=discord.AutoModRuleTriggerType.keyword,
+                                               keyword_filter=words, regex_patterns=patterns),
+                actions=_actions("That message contains a blocked word."),
+                exempt_roles=exempt,
+            )
+        return rules
+
+    @staticmethod
+    def _rule_signature(trigger, actions, exempt_role_ids, enabled: bool) -> tuple:
+        acts = sorted(
+            (str(a.type), a.channel_id or 0, int(a.duration.total_seconds()) if a.duration else 0, a.custom_message or "")
+            for a in actions
+        )
+        return (
+            bool(enabled),
+            str(trigger.type),
+            tuple(sorted(trigger.keyword_filter or [])),
+            tuple(trigger.regex_patterns or []),
+            trigger.mention_limit or 0,
+            tuple(acts),
+            tuple(sorted(exempt_role_ids)),
+        )
+
+    async def sync_native_rules(self, guild: discord.Guild) -> dict:
+        # Reconcile our native AutoMod rules with config: create/edit/delete only what differs.
+        stats = {"created": 0, "updated": 0, "deleted": 0, "unchanged": 0, "failed": 0}
+        me = guild.me
+        if not self._cfg().get("native_sync", True) or not me or not me.guild_permissions.manage_guild:
+            self._native.pop(guild.id, None)
+            return stats
+        try:
+            # only rules this bot created under our exact naming scheme; anything an admin made is left alone
+            existing = {r.name: r for r in await guild.fetch_automod_rules()
+                        if r.creator_id == me.id and r.name.startswith(f"{NATIVE_RULE_PREFIX} · ")}
+        except Exception:
+            self._native.pop(guild.id, None)
+            stats["failed"] += 1
+            return stats
+
+        enforced = set()
+        for feature, want in self._native_rules(guild).items():
+            name = f"{NATIVE_RULE_PREFIX} · {feature}"
+            rule = existing.pop(name, None)
+            want_sig = self._rule_signature(want["trigger"], want["actions"], [r.id for r in want["exempt_roles"]], True)
+            try:
+                if rule is None:
+                    await guild.create_automod_rule(name=name, event_type=discord.AutoModRuleEventType.message_send,
+                                                    enabled=True, reason="AutoMod config sync", **want)
+                    stats["created"] += 1
+                elif self._rule_signature(rule.trigger, rule.actions, rule.exempt_role_ids, rule.enabled) != want_sig:
+                    await rule.edit(enabled=True, reason="AutoMod config sync", **want)
+                    stats["updated"] += 1
+                else:
+                    stats["unchanged"] += 1
+                enforced.add(feature)
+            except Exception:
+                stats["failed"] += 1
+
+        for rule in existing.values():
+            try:
+                await rule.delete(reason="AutoMod config sync: rule no longer configured")
+                stats["deleted"] += 1
+            except Exception:
+                stats["failed"] += 1
+
+        self._native[guild.id] = enforced
+        return stats
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        for guild in self.bot.guilds:
+            await self.sync_native_rules(guild)
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild: discord.Guild):
+        await self.sync_native_rules(guild)
+
+    @app_commands.command(name="automod-sync", description="Push the AutoMod config to Discord's native AutoMod (admins only).")
+    async def automod_sync(self, interaction: discord.Interaction):
+        if not interaction.guild or not is_admin(interaction.user):
+            return await interaction.response.send_message("Admins only.", ephemeral=True)
+        await interaction.response.defer(ephemeral=True)
+        stats = await self.sync_native_rules(interaction.guild)
+        native = ", ".join(sorted(self._native.get(interaction.guild.id, ()))) or "none"
+        await interaction.followup.send(
+            f"🛡️ Native AutoMod sync: {stats['created']} created, {stats['updated']} updated, "
+            f"{stats['deleted']} deleted, {stats['unchanged']} unchanged, {stats['failed']} failed.\n"
+            f"Enforced by Discord: **{native}**", ephemeral=True)
 
     async def _log(self, guild: discord.Guild, text: str):
         ch_name = (self.bot.xcfg.get("channels", {}) or {}).get("mod_log_channel_name", "mod-log")
@@ -34,62 +432,175 @@ class AutoMod(commands.Cog):
             return
         if not isinstance(message.author, discord.Member):
             return
-        if self._is_mod(message.author):
+        if is_automod_exempt(message.author):
             return
 
         content = message.content or ""
+        native = self._native.get(message.guild.id, ())
 
-        # 1) Invite links block
-        if cfg.get("block_invite_links", True) and INVITE_RE.search(content):
+        # 1) Content filter: invite links, blocked words and patterns in a single pass
+        # (invites are skipped when Discord already blocks them; obfuscated words still need our folded scan)
+        hit = self._filter(skip_invites="invite" in native).scan(content)
+        if hit:
+            kind, matched = hit
             try:
                 await message.delete()
             except Exception:
                 pass
-            await self._log(message.guild, f"🚫 Deleted invite link from {message.author.mention} in {message.channel.mention}")
+            if kind == "invite":
+                await self._log(message.guild, f"🚫 Deleted invite link from {message.author.mention} in {message.channel.mention}")
+            else:
+                await self._log(message.guild, f"🚫 Deleted blocked {kind} (`{matched[:50]}`) from {message.author.mention} in {message.channel.mention}")
             return
 
+        feats = features_for(message)
+
+        # 1b) Link reputation: domain allow/deny trie + cached short-link expansion
+        if feats.links and cfg.get("link_filter", True):
+            denied, pending = self._link_analyzer().check(extract_urls(content))
+            if denied:
+                await self._take_action(message, reason=f"blocked link ({denied[0]})")
+                return
+            if pending:
+                self.bot.loop.create_task(self._check_expanded(message, pending))
+
+        # 1c) Attachment hash blocklist (streamed + hashed in the background)
+        if message.attachments and cfg.get("attachment_scan", False):
+            self.bot.loop.create_task(self._scan_attachments(message))
+
         # 2) Mention spam
-        if len(message.mentions) >= int(cfg.get("max_mentions", 6)):
-            await self._take_action(message, reason=f"mention spam ({len(message.mentions)})")
+        if "mentions" not in native and feats.user_mentions >= int(cfg.get("max_mentions", 6)):
+            await self._take_action(message, reason=f"mention spam ({feats.user_mentions})")
             return
 
         # 3) Caps spam
-        letters = [c for c in content if c.isalpha()]
-        if len(letters) >= int(cfg.get("min_caps_length", 12)):
-            caps = sum(1 for c in letters if c.isupper())
-            ratio = caps / max(len(letters), 1)
+        if feats.letters >= int(cfg.get("min_caps_length", 12)):
+            ratio = feats.caps_ratio
             if ratio >= float(cfg.get("max_caps_ratio", 0.75)):
                 await self._take_action(message, reason=f"caps spam ({ratio:.0%})")
                 return
 
-        # 4) Flood spam (messages per window)
+        # 4) Same text from many accounts (raid wave)
+        if cfg.get("wave_enabled", True) and feats.length >= int(cfg.get("wave_min_length", 20)):
+            window = float(cfg.get("wave_window_seconds", 60))
+            det = self._waves.get(message.guild.id)
+            if det is None or det.window != window:
+                det = self._waves[message.guild.id] = WaveDetector(window)
+            now = time.time()
+            cluster = det.add(content, message.channel.id, message.id, message.author.id, now,
+                              min_length=int(cfg.get("wave_min_length", 20)))
+        else:
+            cluster = None
+        if cluster is not None:
+            if feats.links:
+                cluster.signals.add("link")
+            if INVITE_RE.search(content):
+                cluster.signals.add("invite")
+            # raw_mentions only holds <@id> typed in the text, so reply pings don't count
+            if message.raw_mentions or feats.role_mentions or feats.mentions_everyone:
+                cluster.signals.add("mention")
+            if now - message.author.created_at.timestamp() < float(cfg.get("wave_young_account_days", 7)) * 86400:
+                cluster.young.add(message.author.id)
+            if cluster.actioned:
+                await self._wave_action(message.guild, cluster, [(message.channel.id, message.id, message.author.id)], quiet=True)
+                return
+            if len(cluster.users) >= int(cfg.get("wave_min_users", 4)):
+                if self._wave_should_act(cluster, cfg):
+                    cluster.actioned = True
+                    await self._wave_action(message.guild, cluster, list(cluster.refs))
+                    return
+                if not cluster.logged:
+                    # plain copypasta: tell the mods once and keep the messages
+                    cluster.logged = True
+                    await self._log(message.guild, f"🌊 AutoMod wave (log only): {len(cluster.users)} accounts posted the same "
+                                                   f"message, last in {message.channel.mention} — no links, invites, "
+                                                   f"mentions or young accounts, nothing removed")
+
+        # 5) Flood spam (messages per window)
         key = (message.guild.id, message.author.id)
         now = time.time()
         window = int(cfg.get("spam_window_seconds", 8))
-        max_msgs = int(cfg.get("spam_max_messages", 6))
-        arr = self._recent.get(key, [])
-        arr = [t for t in arr if now - t <= window]
-        arr.append(now)
-        self._recent[key] = arr
-        if len(arr) >= max_msgs:
-            await self._take_action(message, reason=f"flood ({len(arr)}/{window}s)")
-
-    async def _take_action(self, message: discord.Message, reason: str):
+        max_msgs = max(1, int(cfg.get("spam_max_messages", 6)))
+        ring = self._recent.get(key)
+        if ring is None or ring.maxlen != max_msgs:
+            ring = self._recent[key] = deque(ring or (), maxlen=max_msgs)
+        ring.append((now, message.channel.id, message.id))
+        # the ring only holds the last max_msgs messages: flood iff the oldest is still in the window
+        if len(ring) == max_msgs and now - ring[0][0] <= window:
+            refs = [(cid, mid) for ts, cid, mid in ring if now - ts <= window]
+            ring.clear()
+            await self._take_action(message, reason=f"flood ({max_msgs}/{window}s)", refs=refs)
+
+    @tasks.loop(seconds=60)
+    async def sweep_recent(self):
+        # drop users whose newest message has left the flood window
+        now = time.time()
+        cutoff = now - int(self._cfg().get("spam_window_seconds", 8))
+        for key in [k for k, ring in self._recent.items() if not ring or ring[-1][0] < cutoff]:
+            del self._recent[key]
+        for guild_id in list(self._waves):
+            self._waves[guild_id].expire(now)
+            if not self._waves[guild_id]:
+                del self._waves[guild_id]
+
+    def _wave_should_act(self, cluster: WaveCluster, cfg: dict) -> bool:
+        # wave_action: "scam" (default) acts only with scam signals, "always" on any wave, "log" never
+        mode = str(cfg.get("wave_action", "scam")).lower()
+        if mode == "always":
+            return True
+        if mode != "scam":
+            return False
+        return bool(cluster.signals) or 2 * len(cluster.young) >= len(cluster.users)
+
+    async def _wave_action(self, guild: discord.Guild, cluster: WaveCluster, refs: list, quiet: bool = False):
+        # One response for the whole cluster: delete every known copy per channel and time out each poster once.
         cfg = self._cfg()
         minutes = int(cfg.get("action_timeout_minutes", 10))
-        try:
-            await message.delete()
-        except Exception:
-            pass
+        await self._purge(guild, [(cid, mid) for cid, mid, _uid in refs], "AutoMod: duplicate message wave")
+
+        until = discord.utils.utcnow() + datetime.timedelta(minutes=minutes)
+        for uid in {uid for _c, _m, uid in refs}:
+            member = guild.get_member(uid)
+            if member is None or is_automod_exempt(member):
+                continue
+            try:
+                await member.timeout(until, reason="AutoMod: duplicate message wave")
+            except Exception:
+                pass
+
+        if not quiet:
+            await self._log(guild, f"🌊 AutoMod wave: {len(cluster.users)} accounts posted the same message "
+                                   f"within {int(time.time() - cluster.first_seen)}s — deleted {len(refs)} messages, "
+                                   f"timed out posters ({minutes}m)")
+
+    async def _purge(self, guild: discord.Guild, refs: list, reason: str):
+        # one bulk delete per channel instead of one REST call per message
+        by_channel = {}
+        for channel_id, message_id in refs:
+            by_channel.setdefault(channel_id, set()).add(message_id)
+        for channel_id, ids in by_channel.items():
+            ch = guild.get_channel_or_thread(channel_id)  # waves often land in threads too
+            if ch is None:
+                continue
+            try:
+                await ch.delete_messages([discord.Object(id=mid) for mid in ids], reason=reason)
+            except Exception:
+                pass
+
+    async def _take_action(self, message: discord.Message, reason: str, refs: list | None = None):
+        cfg = self._cfg()
+        minutes = int(cfg.get("action_timeout_minutes", 10))
+        await self._purge(message.guild, refs or [(message.channel.id, message.id)], f"AutoMod: {reason}")
 
         try:
-            until = discord.utils.utcnow() + discord.timedelta(minutes=minutes)
+            until = discord.utils.utcnow() + datetime.timedelta(minutes=minutes)
             await message.author.timeout(until, reason=f"AutoMod: {reason}")
             await message.channel.send(f"🛡️ {message.author.mention} auto-timeout for **{reason}**.", delete_after=8)
         except Exception:
             pass
 
-        await self._log(message.guild, f"🛡️ AutoMod action on {message.author} — {reason} (timeout {minutes}m)")
+        removed = len(refs) if refs else 1
+        await self._log(message.guild, f"🛡️ AutoMod action on {message.author} — {reason} (timeout {minutes}m, {removed} message(s) removed)")
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(AutoMod(bot))
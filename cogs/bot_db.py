@@ -0,0 +1,92 @@
+import asyncio
+import queue
+import sqlite3
+import threading
+
+# Async bot.db access through one WAL connection owned by a worker thread.
+
+STATEMENT_CACHE_SIZE = 256  # sqlite3 keeps this many compiled statements per connection
+
+
+class BotDB:
+    def __init__(self, path: str):
+        self.path = path
+        self._jobs = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._worker, name=f"db-{self.path}", daemon=True)
+                self._thread.start()
+
+    def _worker(self):
+        con = sqlite3.connect(self.path, cached_statements=STATEMENT_CACHE_SIZE)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=NORMAL")
+        con.execute("PRAGMA busy_timeout=5000")
+        try:
+            while True:
+                job = self._jobs.get()
+                if job is None:
+                    break
+                fn, fut, loop = job
+                try:
+                    with con:  # one transaction per job: commit on success, rollback on error
+                        result = fn(con)
+                except Exception as e:
+                    loop.call_soon_threadsafe(_resolve, fut, None, e)
+                else:
+                    loop.call_soon_threadsafe(_resolve, fut, result, None)
+        finally:
+            con.close()
+
+    async def run(self, fn):
+        # run fn(connection) on the db thread inside a transaction and return its result
+        self._ensure_thread()
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._jobs.put((fn, fut, loop))
+        return await fut
+
+    async def execute(self, sql: str, params=()) -> int:
+        return await self.run(lambda con: con.execute(sql, params).rowcount)
+
+    async def executemany(self, sql: str, rows) -> int:
+        rows = list(rows)
+        return await self.run(lambda con: con.executemany(sql, rows).rowcount)
+
+    async def fetchone(self, sql: str, params=()):
+        return await self.run(lambda con: con.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql: str, params=()) -> list:
+        return await self.run(lambda con: con.execute(sql, params).fetchall())
+
+    def close(self):
+        # queued jobs ahead of the sentinel still run
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                self._jobs.put(None)
+                self._thread.join(timeout=5)
+            self._thread = None
+
+
+def _resolve(fut: asyncio.Future, result, exc):
+    if fut.cancelled():
+        return
+    if exc is not None:
+        fut.set_exception(exc)
+    else:
+        fut.set_result(result)
+
+
+_instances = {}
+
+
+def get_db(path: str) -> BotDB:
+    # one repository (and writer thread) per database file, shared by every cog
+    db = _instances.get(path)
+    if db is None:
+        db = _instances[path] = BotDB(path)
+    return db
@@ -1,55 +1,94 @@
-import asyncio
 import random
 import time
 import discord
 from discord import app_commands
 from discord.ext import commands
 
+from cogs.bot_db import get_db
+from cogs.scheduler import scheduler
+from cogs.migrations import migrate_bot_db
+
+DB_PATH = "bot.db"
+db = get_db(DB_PATH)
+
+
+async def _giveaway_timers():
+    return await db.fetchall("SELECT end_ts,message_id FROM giveaways")
+
+
+async def _pop_giveaway(message_id: int):
+    # -> (row, entries) and delete both in one transaction
+    def pop(con):
+        row = con.execute("SELECT message_id,guild_id,channel_id,winners,prize,end_ts FROM giveaways WHERE message_id=?",
+                          (message_id,)).fetchone()
+        if not row:
+            return None, []
+        entries = [r[0] for r in con.execute("SELECT user_id FROM giveaway_entries WHERE message_id=?", (message_id,))]
+        con.execute("DELETE FROM giveaway_entries WHERE message_id=?", (message_id,))
+        con.execute("DELETE FROM giveaways WHERE message_id=?", (message_id,))
+        return row, entries
+    return await db.run(pop)
+
+
 class GiveawayView(discord.ui.View):
+    # Persistent (registered once with bot.add_view); entries live in bot.db keyed by message id.
     def __init__(self):
         super().__init__(timeout=None)
-        self.entries: set[int] = set()
-        self.message_id: int | None = None  # set after send
-
-    def count(self) -> int:
-        return len(self.entries)
 
-    async def _update_footer(self, interaction: discord.Interaction):
+    async def _update_footer(self, interaction: discord.Interaction, count: int):
         # Update the embed footer with entry count (best-effort)
         try:
             msg = interaction.message
             if not msg or not msg.embeds:
                 return
             emb = msg.embeds[0]
-            emb.set_footer(text=f"Entries: {self.count()} • Use buttons to join/leave")
+            emb.set_footer(text=f"Entries: {count} • Use buttons to join/leave")
             await msg.edit(embed=emb, view=self)
         except Exception:
             pass
 
+    async def _toggle(self, interaction: discord.Interaction, enter: bool):
+        mid = interaction.message.id
+        uid = interaction.user.id
+
+        def apply(con):
+            if not con.execute("SELECT 1 FROM giveaways WHERE message_id=?", (mid,)).fetchone():
+                return None, 0
+            if enter:
+                changed = con.execute("INSERT OR IGNORE INTO giveaway_entries(message_id,user_id) VALUES(?,?)", (mid, uid)).rowcount
+            else:
+                changed = con.execute("DELETE FROM giveaway_entries WHERE message_id=? AND user_id=?", (mid, uid)).rowcount
+            count = con.execute("SELECT COUNT(*) FROM giveaway_entries WHERE message_id=?", (mid,)).fetchone()[0]
+            return bool(changed), count
+
+        changed, count = await db.run(apply)
+        if changed is None:
+            return await interaction.response.send_message("This giveaway has ended.", ephemeral=True)
+        if enter:
+            await interaction.response.send_message("Entered! ✅" if changed else "You’re already entered ✅", ephemeral=True)
+        else:
+            await interaction.response.send_message("Removed you from the giveaway. ✅" if changed else "You weren’t entered.", ephemeral=True)
+        if changed:
+            await self._update_footer(interaction, count)
+
     @discord.ui.button(label="🎉 Enter", style=discord.ButtonStyle.success, custom_id="gw_enter")
     async def enter(self, interaction: discord.Interaction, button: discord.ui.Button):
-        uid = interaction.user.id
-        if uid in self.entries:
-            await interaction.response.send_message("You’re already entered ✅", ephemeral=True)
-            return
-        self.entries.add(uid)
-        await interaction.response.send_message("Entered! ✅", ephemeral=True)
-        await self._update_footer(interaction)
+        await self._toggle(interaction, True)
 
     @discord.ui.button(label="🚪 Leave", style=discord.ButtonStyle.secondary, custom_id="gw_leave")
     async def leave(self, interaction: discord.Interaction, button: discord.ui.Button):
-        uid = interaction.user.id
-        if uid not in self.entries:
-            await interaction.response.send_message("You weren’t entered.", ephemeral=True)
-            return
-        self.entries.remove(uid)
-        await interaction.response.send_message("Removed you from the giveaway. ✅", ephemeral=True)
-        await self._update_footer(interaction)
+        await self._toggle(interaction, False)
 
 class Giveaways(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.active = {}  # guild_id -> dict
+        self.view = GiveawayView()
+        bot.add_view(self.view)  # buttons keep working after a restart
+        scheduler.register("giveaway", self._finish, _giveaway_timers)
+
+    def cog_unload(self):
+        scheduler.unregister("giveaway")
+        self.view.stop()
 
     giveaway = app_commands.Group(name="giveaway", description="Giveaway commands (admins only).")
 
@@ -77,7 +116,6 @@ class Giveaways(commands.Cog):
         winners = max(1, min(10, winners))
         channel = channel or interaction.channel
 
-        view = GiveawayView()
         end_ts = time.time() + minutes * 60
 
         embed = discord.Embed(
@@ -85,59 +123,55 @@ class Giveaways(commands.Cog):
             description=f"**Prize:** {prize}\n**Winners:** {winners}\n**Ends in:** {minutes} minutes",
         )
         embed.set_footer(text="Entries: 0 • Use buttons to join/leave")
-        msg = await channel.send(embed=embed, view=view)
-        view.message_id = msg.id
-
-        self.active[interaction.guild.id] = {
-            "message_id": msg.id,
-            "channel_id": channel.id,
-            "view": view,
-            "winners": winners,
-            "prize": prize,
-            "end_ts": end_ts,
-        }
+        msg = await channel.send(embed=embed, view=self.view)
+
+        await db.execute("INSERT INTO giveaways(message_id,guild_id,channel_id,winners,prize,end_ts) VALUES(?,?,?,?,?,?)",
+                         (msg.id, interaction.guild.id, channel.id, winners, prize, end_ts))
+        scheduler.schedule("giveaway", msg.id, end_ts)
 
         await interaction.response.send_message(f"Giveaway started in {channel.mention}.", ephemeral=True)
-        self.bot.loop.create_task(self._finish(interaction.guild, msg))
 
-    async def _finish(self, guild: discord.Guild, msg: discord.Message):
-        g = self.active.get(guild.id)
+    async def _finish(self, message_id: int):
+        g, entries = await _pop_giveaway(message_id)
         if not g:
             return
-        remaining = max(0, g["end_ts"] - time.time())
-        await asyncio.sleep(remaining)
-
-        g = self.active.get(guild.id)
-        if not g:
+        _, guild_id, channel_id, winners, prize, _end_ts = g
+        guild = self.bot.get_guild(guild_id)
+        ch = guild.get_channel(channel_id) if guild else None
+        if ch is None:
             return
+        try:
+            msg = await ch.fetch_message(message_id)
+        except Exception:
+            msg = None
+        send = msg.reply if msg else ch.send
 
-        entries = list(g["view"].entries)
         if len(entries) == 0:
-            await msg.reply("No one entered 😭")
-            self.active.pop(guild.id, None)
+            await send("No one entered 😭")
             return
 
-        winners_n = min(g["winners"], len(entries))
+        winners_n = min(winners, len(entries))
         picked = random.sample(entries, winners_n)
         mentions = [guild.get_member(uid).mention if guild.get_member(uid) else f"<@{uid}>" for uid in picked]
 
-        await msg.reply(f"🎉 Winner(s): {', '.join(mentions)}\n**Prize:** {g['prize']}\nEntries: {len(entries)}")
-        self.active.pop(guild.id, None)
+        await send(f"🎉 Winner(s): {', '.join(mentions)}\n**Prize:** {prize}\nEntries: {len(entries)}")
 
     @giveaway.command(name="end", description="End the active giveaway now.")
     async def end(self, interaction: discord.Interaction):
         if not self._is_admin(interaction.user):
             return await interaction.response.send_message("Admins only.", ephemeral=True)
-        g = self.active.get(interaction.guild.id)
-        if not g:
+        # newest giveaway in this guild (message ids are snowflakes, so they sort by time)
+        row = await db.fetchone("SELECT message_id FROM giveaways WHERE guild_id=? ORDER BY message_id DESC LIMIT 1",
+                                (interaction.guild.id,))
+        if not row:
             return await interaction.response.send_message("No active giveaway.", ephemeral=True)
 
-        ch = interaction.guild.get_channel(g["channel_id"])
-        msg = await ch.fetch_message(g["message_id"])
-        g["end_ts"] = time.time()
+        now = time.time()
+        await db.execute("UPDATE giveaways SET end_ts=? WHERE message_id=?", (now, row[0]))
+        scheduler.schedule("giveaway", row[0], now)
 
         await interaction.response.send_message("Ending giveaway…", ephemeral=True)
-        self.bot.loop.create_task(self._finish(interaction.guild, msg))
 
 async def setup(bot: commands.Bot):
+    await db.run(migrate_bot_db)  # giveaway tables share bot.db's version sequence
     await bot.add_cog(Giveaways(bot))
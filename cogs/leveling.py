@@ -1,74 +1,699 @@
 import os
+import io
+import csv
+import json
 import time
 import math
+import sqlite3
+import asyncio
+import argparse
+from typing import Literal
+from bisect import bisect_right
+from array import array
+from collections import OrderedDict
 import aiosqlite
 import discord
 from discord import app_commands
-from discord.ext import commands
+from discord.ext import commands, tasks
+
+from cogs.migrations import migrate
+from cogs.permissions import is_admin
 
 DB_PATH = os.path.join("data", "levels.db")
+FLUSH_SECONDS = 5  # write-behind interval for buffered XP
+LEADERBOARD_PAGE_SIZE = 10
+HOT_ROWS_MAX = 5000  # recently-active members kept in memory
+COOLDOWN_BUCKET_SECONDS = 5
+HOUR = 3600
+BULK_CHUNK_ROWS = 5000  # rows per fetch/executemany in bulk tools
+MAX_LEVEL = 100_000
+
+_curve = {"base": 100, "exponent": 1.0}
+_thresholds = [0, 0]  # _thresholds[level] = cumulative XP needed to reach level
+
+def set_curve(base: float = 100, exponent: float = 1.0):
+    _curve["base"] = float(base)
+    _curve["exponent"] = float(exponent)
+    del _thresholds[2:]
 
 def xp_needed_for_level(level: int) -> int:
-    # default curve: 100 * level
-    return 100 * level
+    # default curve: 100 * level (leveling.curve_base * level ** leveling.curve_exponent)
+    return max(1, int(round(_curve["base"] * level ** _curve["exponent"])))
+
+def _extend_thresholds(level: int):
+    while len(_thresholds) <= level:
+        n = len(_thresholds)
+        _thresholds.append(_thresholds[-1] + xp_needed_for_level(n - 1))
+
+def xp_to_reach_level(level: int) -> int:
+    # cumulative XP spent on levels 1..level-1
+    if level <= 1:
+        return 0
+    _extend_thresholds(level)
+    return _thresholds[level]
+
+def total_xp(xp: int, level: int) -> int:
+    return xp_to_reach_level(level) + xp
+
+def level_for_total(total: int) -> tuple[int, int]:
+    # inverse of total_xp(): binary search over the cumulative threshold table
+    total = max(0, int(total))
+    while _thresholds[-1] <= total and len(_thresholds) <= MAX_LEVEL:
+        _extend_thresholds(len(_thresholds) * 2)
+    level = max(1, bisect_right(_thresholds, total) - 1)
+    return level, total - _thresholds[level]
+
+def compile_reward_plan(rewards) -> tuple[list[int], list[str]]:
+    # reward_roles config -> parallel (levels, role_names) lists sorted by level
+    plan = []
+    for r in rewards or []:
+        lvl = int(r.get("level", 0))
+        role_name = r.get("role_name")
+        if lvl and role_name:
+            plan.append((lvl, role_name))
+    plan.sort()
+    return [lvl for lvl, _ in plan], [name for _, name in plan]
+
+def _threshold_table(max_total: int) -> list[int]:
+    # local copy of the cumulative table so bulk jobs in worker threads never touch _thresholds
+    table = [0, 0]
+    while table[-1] <= max_total and len(table) <= MAX_LEVEL:
+        n = len(table)
+        table.append(table[-1] + xp_needed_for_level(n - 1))
+    return table
+
+def _levels_from_totals(totals: list[int]) -> list[tuple[int, int]]:
+    table = _threshold_table(max(totals, default=0))
+    out = []
+    for total in totals:
+        level = max(1, bisect_right(table, total) - 1)
+        out.append((level, total - table[level]))
+    return out
+
+def _record_total(rec: dict, table: list[int]) -> int:
+    # accepts total_xp, or level + xp, or a bare cumulative xp (other bots' exports);
+    # table is the caller's local threshold table, extended here as needed
+    if rec.get("total_xp") not in (None, ""):
+        return max(0, int(float(rec["total_xp"])))
+    if rec.get("level") not in (None, ""):
+        level = min(MAX_LEVEL, max(1, int(float(rec["level"]))))
+        while len(table) <= level:
+            n = len(table)
+            table.append(table[-1] + xp_needed_for_level(n - 1))
+        return table[level] + max(0, int(float(rec.get("xp") or 0)))
+    return max(0, int(float(rec.get("xp") or 0)))
+
+def _levels_v1_baseline(con):
+    con.execute(
+        """CREATE TABLE IF NOT EXISTS xp (
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            xp INTEGER NOT NULL DEFAULT 0,
+            level INTEGER NOT NULL DEFAULT 1,
+            PRIMARY KEY (guild_id, user_id)
+        )"""
+    )
+
+
+def _levels_v2_total_xp(con):
+    # cumulative column, backfilled from the curve (may already exist on unversioned databases)
+    cols = {r[1] for r in con.execute("PRAGMA table_info(xp)")}
+    if "total_xp" in cols:
+        return
+    con.execute("ALTER TABLE xp ADD COLUMN total_xp INTEGER NOT NULL DEFAULT 0")
+    rows = con.execute("SELECT guild_id, user_id, xp, level FROM xp").fetchall()
+    con.executemany("UPDATE xp SET total_xp=? WHERE guild_id=? AND user_id=?",
+                    [(total_xp(int(x), int(l)), g, u) for g, u, x, l in rows])
+
+
+def _levels_v3_rollups(con):
+    # covers leaderboard pages and rank counts without touching the table
+    con.execute("CREATE INDEX IF NOT EXISTS idx_xp_guild_total ON xp (guild_id, total_xp DESC, user_id, level, xp)")
+    con.execute(
+        """CREATE TABLE IF NOT EXISTS activity_hourly (
+            guild_id INTEGER NOT NULL,
+            hour INTEGER NOT NULL,
+            messages INTEGER NOT NULL DEFAULT 0,
+            active_users INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, hour)
+        )"""
+    )
+    con.execute(
+        """CREATE TABLE IF NOT EXISTS activity_channel_hourly (
+            guild_id INTEGER NOT NULL,
+            hour INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            messages INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, hour, channel_id)
+        )"""
+    )
+
+
+def _levels_v4_curve(con):
+    # the curve (level, xp) rows were derived with; one row, shared by every guild
+    con.execute(
+        """CREATE TABLE IF NOT EXISTS curve (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            base REAL NOT NULL,
+            exponent REAL NOT NULL
+        )"""
+    )
+
+
+LEVELS_MIGRATIONS = [
+    _levels_v1_baseline,
+    _levels_v2_total_xp,
+    _levels_v3_rollups,
+    _levels_v4_curve,
+]
+
+
+def migrate_levels_db(db_path: str = DB_PATH) -> tuple[int, int]:
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    con = sqlite3.connect(db_path)
+    try:
+        return migrate(con, LEVELS_MIGRATIONS)
+    finally:
+        con.close()
+
+
+def load_curve(db_path: str, default: tuple) -> tuple[float, float]:
+    # the stored curve; a fresh database adopts `default` (config.yaml) as its curve
+    con = sqlite3.connect(db_path)
+    try:
+        row = con.execute("SELECT base, exponent FROM curve WHERE id=1").fetchone()
+        if row:
+            return float(row[0]), float(row[1])
+        with con:
+            con.execute("INSERT INTO curve (id, base, exponent) VALUES (1, ?, ?)", (float(default[0]), float(default[1])))
+        return float(default[0]), float(default[1])
+    finally:
+        con.close()
+
+
+def recompute_levels(db_path: str, guild_id: int | None = None, chunk: int = BULK_CHUNK_ROWS, curve: tuple | None = None) -> int:
+    # Re-derive (level, xp) from total_xp under the current curve; one transaction.
+    # Pass curve (the one now set) when it changed: it is saved in the same transaction.
+    if curve is not None and guild_id is not None:
+        raise ValueError("a curve change has to recompute every guild")
+    con = sqlite3.connect(db_path)
+    try:
+        done = 0
+        last = 0
+        guild_sql = " AND guild_id=?" if guild_id is not None else ""
+        while True:
+            args = (last, guild_id, chunk) if guild_id is not None else (last, chunk)
+            rows = con.execute(f"SELECT rowid, total_xp FROM xp WHERE rowid>?{guild_sql} ORDER BY rowid LIMIT ?", args).fetchall()
+            if not rows:
+                break
+            levels = _levels_from_totals([int(t) for _, t in rows])
+            con.executemany("UPDATE xp SET level=?, xp=? WHERE rowid=?",
+                            [(lvl, xp, rid) for (rid, _), (lvl, xp) in zip(rows, levels)])
+            done += len(rows)
+            last = rows[-1][0]
+        if curve is not None:
+            con.execute("INSERT OR REPLACE INTO curve (id, base, exponent) VALUES (1, ?, ?)", (float(curve[0]), float(curve[1])))
+        con.commit()
+        return done
+    except Exception:
+        con.rollback()
+        raise
+    finally:
+        con.close()
+
+def export_levels(db_path: str, fp, fmt: str = "csv", guild_id: int | None = None, chunk: int = BULK_CHUNK_ROWS) -> int:
+    con = sqlite3.connect(db_path)
+    try:
+        sql = "SELECT guild_id, user_id, level, xp, total_xp FROM xp"
+        args = ()
+        if guild_id is not None:
+            sql += " WHERE guild_id=?"
+            args = (guild_id,)
+        cur = con.execute(sql + " ORDER BY guild_id, total_xp DESC, user_id", args)
+        cols = ["guild_id", "user_id", "level", "xp", "total_xp"]
+        writer = None
+        if fmt == "csv":
+            writer = csv.writer(fp)
+            writer.writerow(cols)
+        done = 0
+        while True:
+            rows = cur.fetchmany(chunk)
+            if not rows:
+                break
+            if writer:
+                writer.writerows(rows)
+            else:
+                fp.writelines(json.dumps(dict(zip(cols, r))) + "\n" for r in rows)
+            done += len(rows)
+        return done
+    finally:
+        con.close()
+
+def import_levels(db_path: str, fp, fmt: str = "csv", guild_id: int | None = None, chunk: int = BULK_CHUNK_ROWS) -> int:
+    # Upsert rows from CSV/JSONL in one transaction; guild_id overrides the file's column.
+    if fmt == "csv":
+        records = csv.DictReader(fp)
+    else:
+        records = (json.loads(line) for line in fp if line.strip())
+    con = sqlite3.connect(db_path)
+    table = [0, 0]
+    try:
+        done = 0
+        batch = []
+
+        def _write():
+            levels = _levels_from_totals([t for _, _, t in batch])
+            con.executemany("INSERT INTO xp (guild_id, user_id, xp, level, total_xp) VALUES (?,?,?,?,?) "
+                            "ON CONFLICT(guild_id, user_id) DO UPDATE SET "
+                            "xp=excluded.xp, level=excluded.level, total_xp=excluded.total_xp",
+                            [(g, u, xp, lvl, t) for (g, u, t), (lvl, xp) in zip(batch, levels)])
+
+        for rec in records:
+            gid = guild_id if guild_id is not None else int(rec["guild_id"])
+            batch.append((gid, int(rec["user_id"]), _record_total(rec, table)))
+            if len(batch) >= chunk:
+                _write()
+                done += len(batch)
+                batch = []
+        if batch:
+            _write()
+            done += len(batch)
+        con.commit()
+        return done
+    except Exception:
+        con.rollback()
+        raise
+    finally:
+        con.close()
+
+class CooldownWheel:
+    # Expiring key set bucketed by expiry time, so expired keys are dropped a bucket at a time.
+    def __init__(self, bucket_seconds: int = COOLDOWN_BUCKET_SECONDS):
+        self.bucket_seconds = bucket_seconds
+        self._expires = {}  # key -> expires_at
+        self._buckets = {}  # bucket index -> set of keys expiring in it
+        self._swept_to = 0  # every bucket below this index has been cleared
+        self.expired = 0
+
+    def __len__(self):
+        return len(self._expires)
+
+    def active(self, key, now: float) -> bool:
+        exp = self._expires.get(key)
+        return exp is not None and exp > now
+
+    def set(self, key, now: float, ttl: float):
+        self.sweep(now)
+        old = self._expires.get(key)
+        if old is not None:
+            bucket = self._buckets.get(int(old // self.bucket_seconds))
+            if bucket:
+                bucket.discard(key)
+        exp = now + ttl
+        self._expires[key] = exp
+        self._buckets.setdefault(int(exp // self.bucket_seconds), set()).add(key)
+
+    def sweep(self, now: float):
+        current = int(now // self.bucket_seconds)
+        if current <= self._swept_to:
+            return
+        for idx in [i for i in self._buckets if i < current]:
+            for key in self._buckets.pop(idx):
+                self._expires.pop(key, None)
+                self.expired += 1
+        self._swept_to = current
+
+    def stats(self) -> dict:
+        return {"size": len(self._expires), "buckets": len(self._buckets), "expired": self.expired}
+
+class HotRows:
+    # LRU of (guild_id, user_id) -> [xp, level]; dirty rows are pinned until flushed.
+    def __init__(self, maxsize: int = HOT_ROWS_MAX):
+        self.maxsize = maxsize
+        self._rows = OrderedDict()
+        self.dirty = set()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._rows)
+
+    def get(self, key):
+        row = self._rows.get(key)
+        if row is None:
+            self.misses += 1
+            return None
+        self._rows.move_to_end(key)
+        self.hits += 1
+        return row
+
+    def peek(self, key):
+        return self._rows.get(key)
+
+    def setdefault(self, key, row):
+        if key not in self._rows:
+            self._rows[key] = row
+            self.trim()
+        return self._rows[key]
+
+    def put(self, key, row, dirty: bool = True):
+        self._rows[key] = row
+        self._rows.move_to_end(key)
+        if dirty:
+            self.dirty.add(key)
+        self.trim()
+
+    def trim(self):
+        excess = len(self._rows) - self.maxsize
+        if excess <= 0:
+            return
+        victims = []
+        for key in self._rows:  # oldest first
+            if len(victims) >= excess:
+                break
+            if key not in self.dirty:
+                victims.append(key)
+        for key in victims:
+            del self._rows[key]
+        self.evictions += len(victims)
+
+    def items_for_guild(self, guild_id: int | None):
+        # guild_id None: every buffered row
+        return [(k, v) for k, v in self._rows.items() if guild_id is None or k[0] == guild_id]
+
+    def discard(self, key):
+        self._rows.pop(key, None)
+        self.dirty.discard(key)
+
+    def stats(self) -> dict:
+        return {"size": len(self._rows), "dirty": len(self.dirty), "hits": self.hits,
+                "misses": self.misses, "evictions": self.evictions}
+
+class HourlyActivity:
+    # Per-guild counters for the current hour: channel -> slot in an array of message counts.
+    def __init__(self, now: float):
+        self.hour = int(now // HOUR)
+        self._slots = {}  # guild_id -> {channel_id: index into counts}
+        self._counts = {}  # guild_id -> array("I") of messages per channel slot
+        self._users = {}  # guild_id -> user ids seen this hour
+
+    def bump(self, guild_id: int, channel_id: int, user_id: int):
+        slots = self._slots.setdefault(guild_id, {})
+        counts = self._counts.setdefault(guild_id, array("I"))
+        idx = slots.get(channel_id)
+        if idx is None:
+            idx = slots[channel_id] = len(counts)
+            counts.append(0)
+        counts[idx] += 1
+        self._users.setdefault(guild_id, set()).add(user_id)
+
+    def rows(self):
+        # -> (channel rows, guild rows) ready for executemany
+        ch_rows, g_rows = [], []
+        for guild_id, slots in self._slots.items():
+            counts = self._counts[guild_id]
+            for channel_id, idx in slots.items():
+                ch_rows.append((guild_id, self.hour, channel_id, counts[idx]))
+            g_rows.append((guild_id, self.hour, sum(counts), len(self._users.get(guild_id, ()))))
+        return ch_rows, g_rows
+
+    def guild_totals(self, guild_id: int) -> tuple[int, int]:
+        counts = self._counts.get(guild_id)
+        return (sum(counts) if counts else 0), len(self._users.get(guild_id, ()))
+
+    def channel_counts(self, guild_id: int) -> dict:
+        counts = self._counts.get(guild_id)
+        return {cid: counts[i] for cid, i in self._slots.get(guild_id, {}).items()} if counts else {}
+
+class LeaderboardView(discord.ui.View):
+    def __init__(self, cog: "Leveling", *, owner_id: int, guild: discord.Guild):
+        super().__init__(timeout=180)
+        self.cog = cog
+        self.owner_id = owner_id
+        self.guild = guild
+        self.rows: list[tuple] = []
+        self.start = 0  # rank offset of the current page
+        self._cursors: list[tuple | None] = [None]  # keyset cursor for the start of each visited page
+        self._has_next = False
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.owner_id:
+            await interaction.response.send_message("⛔ This menu isn't for you.", ephemeral=True)
+            return False
+        return True
+
+    async def load(self):
+        rows = await self.cog._leaderboard_page(self.guild.id, self._cursors[-1], LEADERBOARD_PAGE_SIZE + 1)
+        self._has_next = len(rows) > LEADERBOARD_PAGE_SIZE
+        self.rows = rows[:LEADERBOARD_PAGE_SIZE]
+        self.prev_btn.disabled = len(self._cursors) <= 1
+        self.next_btn.disabled = not self._has_next
+
+    def make_embed(self) -> discord.Embed:
+        lines = []
+        for i, (uid, lvl, xp, _total) in enumerate(self.rows, start=self.start + 1):
+            m = self.guild.get_member(uid)
+            name = m.display_name if m else str(uid)
+            lines.append(f"**{i}.** {name} — Level {lvl} ({xp}xp)")
+        embed = discord.Embed(title="🏆 Leaderboard", description="\n".join(lines) or "No data yet.")
+        if self.rows:
+            embed.set_footer(text=f"Showing {self.start + 1}-{self.start + len(self.rows)}")
+        return embed
+
+    @discord.ui.button(label="◀ Prev", style=discord.ButtonStyle.secondary)
+    async def prev_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if len(self._cursors) > 1:
+            self._cursors.pop()
+            self.start = max(0, self.start - LEADERBOARD_PAGE_SIZE)
+        await self.load()
+        await interaction.response.edit_message(embed=self.make_embed(), view=self)
+
+    @discord.ui.button(label="Next ▶", style=discord.ButtonStyle.secondary)
+    async def next_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if self._has_next and self.rows:
+            uid, _lvl, _xp, total = self.rows[-1]
+            self._cursors.append((total, uid))
+            self.start += LEADERBOARD_PAGE_SIZE
+        await self.load()
+        await interaction.response.edit_message(embed=self.make_embed(), view=self)
 
 class Leveling(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self._cooldowns = {}  # (guild_id, user_id) -> last_ts
-        self.bot.loop.create_task(self._init_db())
+        self._cooldowns = CooldownWheel()  # (guild_id, user_id) on XP cooldown
+        self._rows = HotRows()  # write-behind buffer + LRU of active members' [xp, level]
+        self._flush_lock = asyncio.Lock()
+        self._bulk_guild = None  # guild a bulk job is running for (None with deltas set: every guild)
+        self._bulk_deltas = None  # (guild_id, user_id) -> XP earned while that job runs
+        self._voice_sessions = {}  # (guild_id, user_id) -> eligible-since timestamp
+        self._activity = HourlyActivity(time.time())
+        self._reward_src = None  # reward_roles list the plan was compiled from
+        self._reward_levels, self._reward_names = [], []
+        self._reward_role_ids = {}  # guild_id -> {role_name: role_id}
+        self._reward_plan()
+        self.flush_xp.start()
+
+    async def cog_load(self):
+        await self._init_db()
+
+    async def cog_unload(self):
+        self.flush_xp.cancel()
+        now = time.time()
+        for guild_id, user_id in list(self._voice_sessions):
+            guild = self.bot.get_guild(guild_id)
+            member = guild.get_member(user_id) if guild else None
+            if member is None:
+                self._voice_sessions.pop((guild_id, user_id), None)
+                continue
+            await self._voice_close(member, now)
+        await self._flush()
+        await self._flush_activity(force=True)
 
     def _cfg(self):
         return (self.bot.xcfg.get("leveling", {}) or {}) if hasattr(self.bot, "xcfg") else {}
 
     async def _init_db(self):
-        os.makedirs("data", exist_ok=True)
-        async with aiosqlite.connect(DB_PATH) as db:
-            await db.execute(
-                """CREATE TABLE IF NOT EXISTS xp (
-                    guild_id INTEGER NOT NULL,
-                    user_id INTEGER NOT NULL,
-                    xp INTEGER NOT NULL DEFAULT 0,
-                    level INTEGER NOT NULL DEFAULT 1,
-                    PRIMARY KEY (guild_id, user_id)
-                )"""
-            )
-            await db.commit()
+        await asyncio.to_thread(migrate_levels_db, DB_PATH)
+        cfg = self._cfg()
+        wanted = (float(cfg.get("curve_base", 100)), float(cfg.get("curve_exponent", 1.0)))
+        # levels.db keeps the curve its rows were built with; config.yaml only seeds a new database
+        stored = await asyncio.to_thread(load_curve, DB_PATH, wanted)
+        set_curve(*stored)
+        if stored != wanted:
+            print(f"⚠️ Leveling: levels.db uses curve base {stored[0]:g}, exponent {stored[1]:g}; "
+                  f"config.yaml curve_base/curve_exponent are ignored, change it with /levels recompute")
 
     async def _get_row(self, guild_id: int, user_id: int):
+        # Read through the write-behind buffer so unflushed XP is never lost.
+        key = (guild_id, user_id)
+        row = self._rows.get(key)
+        if row is not None:
+            return row[0], row[1]
         async with aiosqlite.connect(DB_PATH) as db:
             cur = await db.execute("SELECT xp, level FROM xp WHERE guild_id=? AND user_id=?", (guild_id, user_id))
-            row = await cur.fetchone()
-            if not row:
-                await db.execute("INSERT OR IGNORE INTO xp (guild_id, user_id, xp, level) VALUES (?,?,0,1)", (guild_id, user_id))
+            found = await cur.fetchone()
+        xp, level = (int(found[0]), int(found[1])) if found else (0, 1)
+        # a message may have buffered this key while we were awaiting the DB
+        row = self._rows.setdefault(key, [xp, level])
+        return row[0], row[1]
+
+    def _set_row(self, guild_id: int, user_id: int, xp: int, level: int):
+        self._rows.put((guild_id, user_id), [xp, level])
+
+    async def _flush(self):
+        async with self._flush_lock:
+            await self._write_dirty()
+
+    async def _write_dirty(self) -> bool:
+        # caller holds _flush_lock; the batch is snapshotted before the first await
+        if not self._rows.dirty:
+            return True
+        dirty, self._rows.dirty = self._rows.dirty, set()
+        batch = []
+        for key in dirty:
+            row = self._rows.peek(key)
+            if row is not None:
+                batch.append((key[0], key[1], row[0], row[1], total_xp(row[0], row[1])))
+        try:
+            async with aiosqlite.connect(DB_PATH) as db:
+                await db.executemany("INSERT INTO xp (guild_id, user_id, xp, level, total_xp) VALUES (?,?,?,?,?) "
+                                     "ON CONFLICT(guild_id, user_id) DO UPDATE SET "
+                                     "xp=excluded.xp, level=excluded.level, total_xp=excluded.total_xp",
+                                     batch)
                 await db.commit()
-                return 0, 1
-            return int(row[0]), int(row[1])
+        except Exception:
+            # keep the rows dirty so the next flush retries them
+            self._rows.dirty |= dirty
+            return False
+        self._rows.trim()
+        return True
+
+    async def _fetch_rows(self, keys: list) -> dict:
+        out = {}
+        async with aiosqlite.connect(DB_PATH) as db:
+            for guild_id, user_id in keys:
+                cur = await db.execute("SELECT xp, level FROM xp WHERE guild_id=? AND user_id=?", (guild_id, user_id))
+                found = await cur.fetchone()
+                out[(guild_id, user_id)] = (int(found[0]), int(found[1])) if found else (0, 1)
+        return out
 
-    async def _set_row(self, guild_id: int, user_id: int, xp: int, level: int):
+    async def _rank_position(self, guild_id: int, user_id: int, total: int) -> int:
+        # ties on total_xp are broken by user_id, matching the leaderboard order.
+        # The count is a range scan over idx_xp_guild_total: one seek, then O(rank) index entries (never
+        # the table). Guild tables here are a few thousand rows, so this is kept over an in-memory
+        # order-statistic tree that would have to be rebuilt and kept in step with every flush.
         async with aiosqlite.connect(DB_PATH) as db:
-            await db.execute("INSERT INTO xp (guild_id, user_id, xp, level) VALUES (?,?,?,?) "
-                             "ON CONFLICT(guild_id, user_id) DO UPDATE SET xp=excluded.xp, level=excluded.level",
-                             (guild_id, user_id, xp, level))
-            await db.commit()
+            cur = await db.execute(
+                "SELECT COUNT(*) FROM xp WHERE guild_id=? AND total_xp>=? AND (total_xp>? OR user_id<?)",
+                (guild_id, total, total, user_id))
+            row = await cur.fetchone()
+        return int(row[0]) + 1
+
+    async def _leaderboard_page(self, guild_id: int, after: tuple | None, limit: int):
+        # keyset pagination: resume strictly after the (total_xp, user_id) of the previous page
+        async with aiosqlite.connect(DB_PATH) as db:
+            if after is None:
+                cur = await db.execute(
+                    "SELECT user_id, level, xp, total_xp FROM xp WHERE guild_id=? "
+                    "ORDER BY total_xp DESC, user_id ASC LIMIT ?", (guild_id, limit))
+            else:
+                last_total, last_uid = after
+                cur = await db.execute(
+                    "SELECT user_id, level, xp, total_xp FROM xp WHERE guild_id=? AND total_xp<=? "
+                    "AND (total_xp<? OR user_id>?) ORDER BY total_xp DESC, user_id ASC LIMIT ?",
+                    (guild_id, last_total, last_total, last_uid, limit))
+            return await cur.fetchall()
+
+    async def _flush_activity(self, force: bool = False):
+        # roll the hourly counters into the rollup tables once the hour is over (or on shutdown)
+        now = time.time()
+        if not force and int(now // HOUR) == self._activity.hour:
+            return
+        done, self._activity = self._activity, HourlyActivity(now)
+        ch_rows, g_rows = done.rows()
+        if not g_rows:
+            return
+        try:
+            async with aiosqlite.connect(DB_PATH) as db:
+                # a partial hour flushed at shutdown is merged when the rest of it is flushed
+                await db.executemany("INSERT INTO activity_channel_hourly (guild_id, hour, channel_id, messages) VALUES (?,?,?,?) "
+                                     "ON CONFLICT(guild_id, hour, channel_id) DO UPDATE SET messages=messages+excluded.messages",
+                                     ch_rows)
+                await db.executemany("INSERT INTO activity_hourly (guild_id, hour, messages, active_users) VALUES (?,?,?,?) "
+                                     "ON CONFLICT(guild_id, hour) DO UPDATE SET messages=messages+excluded.messages, "
+                                     "active_users=MAX(active_users, excluded.active_users)",
+                                     g_rows)
+                await db.commit()
+        except Exception:
+            pass
+
+    @tasks.loop(seconds=FLUSH_SECONDS)
+    async def flush_xp(self):
+        await self._flush()
+        await self._flush_activity()
+
+    @flush_xp.before_loop
+    async def _before_flush(self):
+        await self.bot.wait_until_ready()
+
+    def _reward_plan(self):
+        rewards = self._cfg().get("reward_roles")
+        if rewards is not self._reward_src:
+            # config was (re)loaded: recompile and drop cached role IDs
+            self._reward_src = rewards
+            self._reward_levels, self._reward_names = compile_reward_plan(rewards)
+            self._reward_role_ids.clear()
+        return self._reward_levels, self._reward_names
+
+    async def _reward_role_ids_for(self, guild: discord.Guild, earned: list) -> dict:
+        ids = self._reward_role_ids.get(guild.id)
+        if ids is None:
+            wanted = set(self._reward_names)
+            ids = self._reward_role_ids[guild.id] = {r.name: r.id for r in guild.roles if r.name in wanted}
+        # create a reward role only once someone earns it; a failed create is retried next level-up
+        for name in earned:
+            if name in ids:
+                continue
+            try:
+                role = await guild.create_role(name=name, reason="Leveling reward role")
+                ids[name] = role.id
+            except Exception:
+                pass
+        return ids
 
     async def _maybe_reward_roles(self, member: discord.Member, new_level: int):
-        rewards = (self._cfg().get("reward_roles") or [])
-        for r in rewards:
-            lvl = int(r.get("level", 0))
-            role_name = r.get("role_name")
-            if lvl and role_name and new_level >= lvl:
-                role = discord.utils.get(member.guild.roles, name=role_name)
-                if role is None:
-                    try:
-                        role = await member.guild.create_role(name=role_name, reason="Leveling reward role")
-                    except Exception:
-                        continue
-                if role not in member.roles:
-                    try:
-                        await member.add_roles(role, reason=f"Reached level {new_level}")
-                    except Exception:
-                        pass
+        levels, names = self._reward_plan()
+        earned = names[:bisect_right(levels, new_level)]
+        if not earned:
+            return
+        ids = await self._reward_role_ids_for(member.guild, earned)
+        missing = []
+        for name in earned:
+            rid = ids.get(name)
+            if rid is None or member.get_role(rid) is not None:
+                continue
+            role = member.guild.get_role(rid)
+            if role is not None:
+                missing.append(role)
+        if missing:
+            try:
+                await member.add_roles(*missing, reason=f"Reached level {new_level}")
+            except Exception:
+                pass
+
+    @commands.Cog.listener()
+    async def on_guild_role_create(self, role: discord.Role):
+        self._reward_role_ids.pop(role.guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role):
+        self._reward_role_ids.pop(role.guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before: discord.Role, after: discord.Role):
+        if before.name != after.name:
+            self._reward_role_ids.pop(after.guild.id, None)
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
@@ -80,15 +705,21 @@ class Leveling(commands.Cog):
         if not isinstance(message.author, discord.Member):
             return
 
-        key = (message.guild.id, message.author.id)
         now = time.time()
-        cd = int(cfg.get("cooldown_seconds", 60))
-        if now - self._cooldowns.get(key, 0) < cd:
+        if int(now // HOUR) != self._activity.hour:
+            await self._flush_activity()
+        self._activity.bump(message.guild.id, message.channel.id, message.author.id)
+
+        key = (message.guild.id, message.author.id)
+        if self._cooldowns.active(key, now):
             return
-        self._cooldowns[key] = now
+        self._cooldowns.set(key, now, int(cfg.get("cooldown_seconds", 60)))
 
         add = int(cfg.get("xp_per_message", 10))
-        xp, level = await self._get_row(message.guild.id, message.author.id)
+        await self._award_xp(message.author, add, announce_in=message.channel)
+
+    async def _award_xp(self, member: discord.Member, add: int, announce_in: discord.abc.Messageable | None = None):
+        xp, level = await self._get_row(member.guild.id, member.id)
         xp += add
 
         # level up loop
@@ -98,37 +729,298 @@ class Leveling(commands.Cog):
             level += 1
             leveled = True
 
-        await self._set_row(message.guild.id, message.author.id, xp, level)
+        if self._bulk_deltas is not None and self._bulk_guild in (None, member.guild.id):
+            # a bulk job is rewriting this guild: remember the gain so it survives the job
+            key = (member.guild.id, member.id)
+            self._bulk_deltas[key] = self._bulk_deltas.get(key, 0) + add
+        self._set_row(member.guild.id, member.id, xp, level)
         if leveled:
-            await self._maybe_reward_roles(message.author, level)
-            try:
-                await message.channel.send(f"✨ {message.author.mention} leveled up to **Level {level}**!", delete_after=8)
-            except Exception:
-                pass
+            await self._maybe_reward_roles(member, level)
+            if announce_in is not None:
+                try:
+                    await announce_in.send(f"✨ {member.mention} leveled up to **Level {level}**!", delete_after=8)
+                except Exception:
+                    pass
+
+    def _voice_eligible(self, member: discord.Member, state: discord.VoiceState | None) -> bool:
+        cfg = self._cfg()
+        if member.bot or state is None or state.channel is None:
+            return False
+        ch = state.channel
+        if ch == member.guild.afk_channel or ch.name == cfg.get("voice_afk_channel_name", "AFK"):
+            return False
+        if state.self_deaf or state.deaf:
+            return False
+        cat = cfg.get("voice_category_name")
+        if cat and (ch.category is None or ch.category.name != cat):
+            return False
+        return True
+
+    def _voice_open(self, member: discord.Member, now: float):
+        self._voice_sessions.setdefault((member.guild.id, member.id), now)
+
+    async def _voice_close(self, member: discord.Member, now: float):
+        # credit the elapsed interval; the XP lands in the write-behind buffer like text XP
+        started = self._voice_sessions.pop((member.guild.id, member.id), None)
+        if started is None:
+            return
+        per_minute = float(self._cfg().get("voice_xp_per_minute", 5))
+        add = int((now - started) / 60 * per_minute)
+        if add > 0:
+            await self._award_xp(member, add)
+
+    @commands.Cog.listener()
+    async def on_voice_state_update(self, member: discord.Member, before: discord.VoiceState, after: discord.VoiceState):
+        cfg = self._cfg()
+        if not cfg.get("enabled", True) or not cfg.get("voice_enabled", True):
+            return
+        now = time.time()
+        was = (member.guild.id, member.id) in self._voice_sessions
+        now_eligible = self._voice_eligible(member, after)
+        if was and (not now_eligible or before.channel != after.channel):
+            await self._voice_close(member, now)
+        if now_eligible:
+            self._voice_open(member, now)
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # pick up members who were already in voice when we (re)connected
+        cfg = self._cfg()
+        if not cfg.get("enabled", True) or not cfg.get("voice_enabled", True):
+            return
+        now = time.time()
+        for guild in self.bot.guilds:
+            for ch in guild.voice_channels:
+                for member in ch.members:
+                    if self._voice_eligible(member, member.voice):
+                        self._voice_open(member, now)
 
     @app_commands.command(name="rank", description="Show your level + XP.")
     async def rank(self, interaction: discord.Interaction, member: discord.Member | None = None):
         member = member or interaction.user
         xp, level = await self._get_row(interaction.guild.id, member.id)
         need = xp_needed_for_level(level)
+        await self._flush()
+        pos = await self._rank_position(interaction.guild.id, member.id, total_xp(xp, level))
         embed = discord.Embed(title=f"Rank — {member.display_name}")
+        embed.add_field(name="Rank", value=f"#{pos}", inline=True)
         embed.add_field(name="Level", value=str(level), inline=True)
         embed.add_field(name="XP", value=f"{xp}/{need}", inline=True)
         await interaction.response.send_message(embed=embed, ephemeral=False)
 
-    @app_commands.command(name="leaderboard", description="Top 10 levels in this server.")
+    @app_commands.command(name="leaderboard", description="Server leaderboard (10 per page).")
     async def leaderboard(self, interaction: discord.Interaction):
+        await self._flush()
+        view = LeaderboardView(self, owner_id=interaction.user.id, guild=interaction.guild)
+        await view.load()
+        await interaction.response.send_message(embed=view.make_embed(), view=view)
+
+    async def _activity_summary(self, guild_id: int, hours: int):
+        now = time.time()
+        since = int(now // HOUR) - hours + 1
         async with aiosqlite.connect(DB_PATH) as db:
-            cur = await db.execute("SELECT user_id, level, xp FROM xp WHERE guild_id=? ORDER BY level DESC, xp DESC LIMIT 10", (interaction.guild.id,))
-            rows = await cur.fetchall()
+            cur = await db.execute("SELECT COALESCE(SUM(messages),0), COALESCE(MAX(active_users),0), COALESCE(SUM(active_users),0), COUNT(*) "
+                                   "FROM activity_hourly WHERE guild_id=? AND hour>=?", (guild_id, since))
+            msgs, peak, user_hours, n_hours = await cur.fetchone()
+            cur = await db.execute("SELECT channel_id, SUM(messages) FROM activity_channel_hourly WHERE guild_id=? AND hour>=? "
+                                   "GROUP BY channel_id", (guild_id, since))
+            channels = dict(await cur.fetchall())
+            cur = await db.execute("SELECT hour, messages FROM activity_hourly WHERE guild_id=? AND hour>=? "
+                                   "ORDER BY messages DESC LIMIT 1", (guild_id, since))
+            busiest = await cur.fetchone()
+        live_msgs, live_users = self._activity.guild_totals(guild_id)
+        msgs += live_msgs
+        peak = max(peak, live_users)
+        if live_msgs:
+            user_hours += live_users
+            n_hours += 1
+        for cid, c in self._activity.channel_counts(guild_id).items():
+            channels[cid] = channels.get(cid, 0) + c
+        top = sorted(channels.items(), key=lambda kv: kv[1], reverse=True)[:5]
+        return {
+            "messages": int(msgs),
+            "peak_active": int(peak),
+            "avg_active": (user_hours / n_hours) if n_hours else 0.0,
+            "top_channels": top,
+            "busiest_hour": busiest,
+        }
 
-        lines = []
-        for i, (uid, lvl, xp) in enumerate(rows, start=1):
-            m = interaction.guild.get_member(uid)
-            name = m.display_name if m else str(uid)
-            lines.append(f"**{i}.** {name} — Level {lvl} ({xp}xp)")
-        embed = discord.Embed(title="🏆 Leaderboard", description="\n".join(lines) or "No data yet.")
+    @app_commands.command(name="serverstats", description="Chat activity for the last 24h / 7d / 30d.")
+    async def serverstats(self, interaction: discord.Interaction):
+        if not interaction.guild:
+            return await interaction.response.send_message("Server only.", ephemeral=True)
+        embed = discord.Embed(title=f"📈 Server stats — {interaction.guild.name}")
+        week = None
+        for label, hours in (("24h", 24), ("7d", 24 * 7), ("30d", 24 * 30)):
+            st = await self._activity_summary(interaction.guild.id, hours)
+            if hours == 24 * 7:
+                week = st
+            embed.add_field(
+                name=label,
+                value=f"Messages: **{st['messages']}**\n"
+                      f"Active/hour: **{st['avg_active']:.1f}** avg, **{st['peak_active']}** peak",
+                inline=True,
+            )
+        if week and week["top_channels"]:
+            lines = []
+            for cid, c in week["top_channels"]:
+                ch = interaction.guild.get_channel(cid)
+                lines.append(f"{ch.mention if ch else f'`{cid}`'} — {c}")
+            embed.add_field(name="Top channels (7d)", value="\n".join(lines), inline=False)
+        if week and week["busiest_hour"]:
+            hour, c = week["busiest_hour"]
+            embed.add_field(name="Busiest hour (7d)", value=f"<t:{hour * HOUR}:f> — {c} messages", inline=False)
         await interaction.response.send_message(embed=embed)
 
+    levels = app_commands.Group(name="levels", description="Leveling data tools (admins only).")
+
+    async def _bulk_job(self, guild_id: int | None, job, *args, curve: tuple | None = None):
+        # Run a bulk DB job off the loop while flushes are held. Buffered XP is flushed under the old
+        # curve first; XP earned meanwhile is tracked as deltas and added on top of the job's rows.
+        async with self._flush_lock:
+            old_curve = (_curve["base"], _curve["exponent"])
+            self._bulk_guild, self._bulk_deltas = guild_id, {}  # same step as the flush snapshot
+            try:
+                if not await self._write_dirty():
+                    raise RuntimeError("could not flush buffered XP")
+                if curve is not None:
+                    set_curve(*curve)
+                result = await asyncio.to_thread(job, *args)
+            except Exception:
+                # nothing was written by the job; the buffer still holds every gain under the old curve
+                set_curve(*old_curve)
+                self._bulk_guild, self._bulk_deltas = None, None
+                raise
+
+            fetched = {}
+            while True:
+                missing = [k for k in self._bulk_deltas if k not in fetched]
+                if not missing:
+                    break
+                fetched.update(await self._fetch_rows(missing))
+            # from here on no awaits: swap the buffer for job result + deltas in one step
+            deltas = self._bulk_deltas
+            self._bulk_guild, self._bulk_deltas = None, None
+            for key, _row in self._rows.items_for_guild(guild_id):
+                self._rows.discard(key)
+            for key, gained in deltas.items():
+                xp, level = fetched[key]
+                lvl, rem = level_for_total(total_xp(xp, level) + gained)
+                self._rows.put(key, [rem, lvl])
+        return result
+
+    @levels.command(name="recompute", description="Recompute levels from total XP (a new curve applies to every server).")
+    @app_commands.describe(base="New curve base (XP for level n = base * n^exponent)", exponent="New curve exponent")
+    async def levels_recompute(self, interaction: discord.Interaction, base: float | None = None, exponent: float | None = None):
+        if not interaction.guild or not is_admin(interaction.user):
+            return await interaction.response.send_message("Admins only.", ephemeral=True)
+        await interaction.response.defer(ephemeral=True)
+        curve = None
+        if base is not None or exponent is not None:
+            curve = (float(base if base is not None else _curve["base"]),
+                     float(exponent if exponent is not None else _curve["exponent"]))
+            if curve == (_curve["base"], _curve["exponent"]):
+                curve = None
+        started = time.perf_counter()
+        try:
+            if curve is None:
+                n = await self._bulk_job(interaction.guild.id, recompute_levels, DB_PATH, interaction.guild.id)
+            else:
+                # one curve for the whole bot: every guild is rebuilt and the curve saved with it
+                n = await self._bulk_job(None, recompute_levels, DB_PATH, None, BULK_CHUNK_ROWS, curve, curve=curve)
+        except Exception as e:
+            return await interaction.followup.send(f"Recompute failed: {e}", ephemeral=True)
+        took = time.perf_counter() - started
+        note = ""
+        if curve is not None:
+            note = f"\nCurve is now base **{_curve['base']:g}**, exponent **{_curve['exponent']:g}** for every server (saved in levels.db)."
+        await interaction.followup.send(f"✅ Recomputed **{n}** rows in {took:.2f}s.{note}", ephemeral=True)
+
+    @levels.command(name="export", description="Export this server's XP table.")
+    async def levels_export(self, interaction: discord.Interaction, fmt: Literal["csv", "jsonl"] = "csv"):
+        if not interaction.guild or not is_admin(interaction.user):
+            return await interaction.response.send_message("Admins only.", ephemeral=True)
+        await interaction.response.defer(ephemeral=True)
+        await self._flush()
+
+        def _run():
+            buf = io.StringIO()
+            n = export_levels(DB_PATH, buf, fmt, interaction.guild.id)
+            return n, buf.getvalue().encode("utf-8")
+
+        n, data = await asyncio.to_thread(_run)
+        file = discord.File(io.BytesIO(data), filename=f"levels-{interaction.guild.id}.{fmt}")
+        await interaction.followup.send(f"📦 Exported **{n}** rows.", file=file, ephemeral=True)
+
+    @levels.command(name="import", description="Import XP from a CSV/JSONL file (replaces matching members).")
+    @app_commands.describe(file="CSV or JSONL with user_id and total_xp, or level + xp")
+    async def levels_import(self, interaction: discord.Interaction, file: discord.Attachment):
+        if not interaction.guild or not is_admin(interaction.user):
+            return await interaction.response.send_message("Admins only.", ephemeral=True)
+        fmt = "jsonl" if file.filename.lower().endswith((".jsonl", ".json")) else "csv"
+        await interaction.response.defer(ephemeral=True)
+        try:
+            text = (await file.read()).decode("utf-8-sig")
+            n = await self._bulk_job(interaction.guild.id, import_levels, DB_PATH, io.StringIO(text), fmt, interaction.guild.id)
+        except Exception as e:
+            return await interaction.followup.send(f"Import failed: {e}", ephemeral=True)
+        await interaction.followup.send(f"✅ Imported **{n}** rows.", ephemeral=True)
+
+    @app_commands.command(name="levelcache", description="Leveling cache stats (admins only).")
+    async def levelcache(self, interaction: discord.Interaction):
+        if not interaction.guild or not is_admin(interaction.user):
+            return await interaction.response.send_message("Admins only.", ephemeral=True)
+        self._cooldowns.sweep(time.time())
+        rows = self._rows.stats()
+        cds = self._cooldowns.stats()
+        embed = discord.Embed(title="📊 Leveling cache")
+        embed.add_field(name="XP rows", value="\n".join(f"{k}: {v}" for k, v in rows.items()), inline=True)
+        embed.add_field(name="Cooldowns", value="\n".join(f"{k}: {v}" for k, v in cds.items()), inline=True)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
 async def setup(bot: commands.Bot):
     await bot.add_cog(Leveling(bot))
+
+def main():
+    # Offline tool: python -m cogs.leveling {recompute,export,import} ...
+    cfg = {}
+    try:
+        import yaml
+        with open("config.yaml", "r", encoding="utf-8") as f:
+            cfg = (yaml.safe_load(f) or {}).get("leveling", {}) or {}
+    except Exception:
+        pass
+    parser = argparse.ArgumentParser(description="Bulk tools for data/levels.db")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--guild", type=int, default=None, help="limit to one guild (import: override guild_id)")
+    parser.add_argument("--base", type=float, default=None, help="recompute: new curve base (every guild)")
+    parser.add_argument("--exponent", type=float, default=None, help="recompute: new curve exponent (every guild)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("recompute")
+    for name in ("export", "import"):
+        p = sub.add_parser(name)
+        p.add_argument("path")
+        p.add_argument("--format", choices=["csv", "jsonl"], default=None)
+    args = parser.parse_args()
+
+    migrate_levels_db(args.db)
+    stored = load_curve(args.db, (float(cfg.get("curve_base", 100)), float(cfg.get("curve_exponent", 1.0))))
+    curve = (args.base if args.base is not None else stored[0], args.exponent if args.exponent is not None else stored[1])
+    if curve != stored and (args.cmd != "recompute" or args.guild is not None):
+        parser.error("--base/--exponent change the curve for every guild: use them with recompute and no --guild")
+    set_curve(*curve)
+    started = time.perf_counter()
+    if args.cmd == "recompute":
+        n = recompute_levels(args.db, args.guild, curve=curve if curve != stored else None)
+    else:
+        fmt = args.format or ("jsonl" if args.path.lower().endswith((".jsonl", ".json")) else "csv")
+        if args.cmd == "export":
+            with open(args.path, "w", encoding="utf-8", newline="") as f:
+                n = export_levels(args.db, f, fmt, args.guild)
+        else:
+            with open(args.path, "r", encoding="utf-8-sig", newline="") as f:
+                n = import_levels(args.db, f, fmt, args.guild)
+    print(f"{args.cmd}: {n} rows in {time.perf_counter() - started:.2f}s")
+
+if __name__ == "__main__":
+    main()
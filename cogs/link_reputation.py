@@ -0,0 +1,190 @@
+import re
+import time
+import asyncio
+from collections import OrderedDict
+from urllib.parse import urlsplit, urlunsplit, urljoin
+
+import aiohttp
+
+# URL extraction, domain allow/deny matching and cached short-link expansion for AutoMod.
+
+URL_RE = re.compile(r"https?://[^\s<>\"'`]+", re.IGNORECASE)
+
+DEFAULT_SHORTENERS = [
+    "bit.ly", "tinyurl.com", "t.co", "goo.gl", "is.gd", "cutt.ly", "rb.gy", "ow.ly",
+    "shorturl.at", "tiny.cc", "buff.ly", "rebrand.ly", "t.ly", "s.id", "v.gd",
+]
+
+EXPAND_TTL_SECONDS = 6 * 60 * 60
+EXPAND_FAIL_TTL_SECONDS = 10 * 60
+EXPAND_CACHE_SIZE = 2048
+EXPAND_MAX_HOPS = 3
+EXPAND_TIMEOUT_SECONDS = 5
+EXPAND_CONCURRENCY = 4
+
+ALLOW = "allow"
+DENY = "deny"
+
+
+def normalize_host(host: str) -> str:
+    host = (host or "").strip().rstrip(".").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    try:
+        host = host.encode("idna").decode("ascii")
+    except Exception:
+        pass
+    return host
+
+
+def host_of(url: str) -> str:
+    try:
+        return normalize_host(urlsplit(url).hostname or "")
+    except ValueError:
+        return ""
+
+
+def normalize_url(url: str) -> tuple[str, str] | None:
+    # -> (host, normalized url) with trailing punctuation from chat text trimmed
+    url = url.rstrip(").,!?;:>]*_~|")
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return None
+    host = normalize_host(parts.hostname or "")
+    if not host:
+        return None
+    path = parts.path or "/"
+    return host, urlunsplit((parts.scheme.lower(), host, path, parts.query, ""))
+
+
+def extract_urls(text: str) -> list[tuple[str, str]]:
+    seen = set()
+    out = []
+    for m in URL_RE.finditer(text or ""):
+        norm = normalize_url(m.group(0))
+        if norm and norm[1] not in seen:
+            seen.add(norm[1])
+            out.append(norm)
+    return out
+
+
+class DomainTrie:
+    # Domains stored by reversed labels (com -> example -> www), so a lookup walks at most one node per label
+    # and the most specific listed suffix wins.
+    def __init__(self):
+        self._root = {}
+
+    def add(self, domain: str, verdict: str):
+        node = self._root
+        for label in reversed(normalize_host(domain).split(".")):
+            node = node.setdefault(label, {})
+        node[""] = verdict
+
+    def lookup(self, host: str) -> str | None:
+        node = self._root
+        verdict = None
+        for label in reversed(host.split(".")):
+            node = node.get(label)
+            if node is None:
+                break
+            verdict = node.get("", verdict)
+        return verdict
+
+
+class ExpansionCache:
+    # Bounded LRU of shortener url -> final url (None when expansion failed), each entry with its own expiry.
+    def __init__(self, maxsize: int = EXPAND_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._items = OrderedDict()  # url -> (expires_at, final_url | None)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, url: str, now: float):
+        item = self._items.get(url)
+        if item is None or item[0] <= now:
+            if item is not None:
+                del self._items[url]
+            self.misses += 1
+            return False, None
+        self._items.move_to_end(url)
+        self.hits += 1
+        return True, item[1]
+
+    def put(self, url: str, final: str | None, now: float):
+        ttl = EXPAND_TTL_SECONDS if final else EXPAND_FAIL_TTL_SECONDS
+        self._items[url] = (now + ttl, final)
+        self._items.move_to_end(url)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        return {"size": len(self._items), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+class LinkAnalyzer:
+    def __init__(self, cfg: dict):
+        self.trie = DomainTrie()
+        for d in cfg.get("allowed_domains") or []:
+            self.trie.add(str(d), ALLOW)
+        for d in cfg.get("blocked_domains") or []:
+            self.trie.add(str(d), DENY)
+        self.shorteners = DomainTrie()
+        for d in cfg.get("shortener_domains") or DEFAULT_SHORTENERS:
+            self.shorteners.add(str(d), "short")
+        self.cache = ExpansionCache()
+        self._inflight = {}  # url -> asyncio.Task
+        self._sem = asyncio.Semaphore(EXPAND_CONCURRENCY)
+
+    def verdict(self, host: str) -> str | None:
+        return self.trie.lookup(host)
+
+    def check(self, urls: list[tuple[str, str]]) -> tuple[tuple[str, str] | None, list[str]]:
+        # Synchronous pass: -> (first denied (host, url) or None, shortener urls not yet in the cache)
+        now = time.time()
+        pending = []
+        for host, url in urls:
+            v = self.verdict(host)
+            if v == DENY:
+                return (host, url), []
+            if v == ALLOW or not self.shorteners.lookup(host):
+                continue
+            cached, final = self.cache.get(url, now)
+            if not cached:
+                pending.append(url)
+            elif final:
+                fhost = host_of(final)
+                if self.verdict(fhost) == DENY:
+                    return (fhost, url), []
+        return None, pending
+
+    async def expand(self, url: str) -> str | None:
+        task = self._inflight.get(url)
+        if task is None:
+            task = self._inflight[url] = asyncio.ensure_future(self._expand(url))
+            task.add_done_callback(lambda _t: self._inflight.pop(url, None))
+        return await task
+
+    async def _expand(self, url: str) -> str | None:
+        final = None
+        async with self._sem:
+            try:
+                timeout = aiohttp.ClientTimeout(total=EXPAND_TIMEOUT_SECONDS)
+                async with aiohttp.ClientSession(timeout=timeout) as s:
+                    current = url
+                    for _ in range(EXPAND_MAX_HOPS):
+                        async with s.head(current, allow_redirects=False,
+                                          headers={"User-Agent": "XonarousLIVE-DiscordBot/1.0"}) as r:
+                            loc = r.headers.get("Location")
+                        if not loc:
+                            break
+                        current = urljoin(current, loc)
+                        if not self.shorteners.lookup(host_of(current)):
+                            break
+                    final = current if current != url else None
+            except Exception:
+                final = None
+        self.cache.put(url, final, time.time())
+        return final
@@ -2,21 +2,21 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 
-# Admin role that can use /lock and /unlock (plus anyone with Administrator perm)
-ADMIN_ROLE_ID = 1450553389971800185
+from cogs.overwrites import SEND_DENIED
+from cogs.permissions import is_admin
 
 # Owners who can use server-wide lockdown
 OWNER_IDS = {289409320318402560, 369632653374390274}
 
 BRAND_GREEN = discord.Colour.from_rgb(46, 204, 113)
 
+# Member roles that get the same deny as @everyone (extra safety for servers with complex perms)
+LOCK_ROLE_NAMES = {"Xonar Squad", "Unverified", "Niet Geverifieerd"}
+
 
 def _has_admin(interaction: discord.Interaction) -> bool:
-    if not isinstance(interaction.user, discord.Member):
-        return False
-    if interaction.user.guild_permissions.administrator:
-        return True
-    return any(r.id == ADMIN_ROLE_ID for r in interaction.user.roles)
+    # Admin role or Administrator perm can use /lock and /unlock
+    return is_admin(interaction.user)
 
 
 def _bot_can_manage_channel(interaction: discord.Interaction) -> bool:
@@ -34,17 +34,9 @@ def _locked_overwrite(base: discord.PermissionOverwrite, locked: bool) -> discor
     # Deny messaging + reactions + thread posting when locked.
     # Important: explicit DENY beats any role allow (unless the member has Administrator).
     if locked:
-        base.send_messages = False
-        base.add_reactions = False
-        base.create_public_threads = False
-        base.create_private_threads = False
-        base.send_messages_in_threads = False
+        base.update(**SEND_DENIED)
     else:
-        base.send_messages = None
-        base.add_reactions = None
-        base.create_public_threads = None
-        base.create_private_threads = None
-        base.send_messages_in_threads = None
+        base.update(**{perm: None for perm in SEND_DENIED})
     return base
 
 
@@ -59,9 +51,8 @@ async def _apply_lock(channel: discord.TextChannel, locked: bool, reason: str):
     # Also apply deny to common member roles if configured (extra safety for servers with complex perms)
     roles_cfg = (getattr(guild, "bot", None) and {})  # placeholder; not used
     # We'll just try a few known role names if they exist
-    common_role_names = {"Xonar Squad", "Unverified", "Niet Geverifieerd"}
     for r in guild.roles:
-        if r.name in common_role_names:
+        if r.name in LOCK_ROLE_NAMES:
             ow_r = channel.overwrites_for(r)
             ow_r = _locked_overwrite(ow_r, locked)
             await channel.set_permissions(r, overwrite=ow_r, reason=reason)
@@ -77,6 +68,21 @@ async def _apply_lock(channel: discord.TextChannel, locked: bool, reason: str):
         pass
 
 
+async def _lock_guild(guild: discord.Guild, locked: bool, reason: str) -> tuple[int, int]:
+    # Lock/unlock every text channel except #rules. Returns (done, failed).
+    done = 0
+    failed = 0
+    for ch in guild.text_channels:
+        if ch.name == "rules":
+            continue
+        try:
+            await _apply_lock(ch, locked, reason=reason)
+            done += 1
+        except Exception:
+            failed += 1
+    return done, failed
+
+
 class Locks(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
@@ -130,16 +136,7 @@ class Locks(commands.Cog):
         guild = interaction.guild
         await interaction.response.defer(ephemeral=True)
 
-        locked = 0
-        failed = 0
-        for ch in guild.text_channels:
-            if ch.name == "rules":
-                continue
-            try:
-                await _apply_lock(ch, True, reason=f"Lockdown by {interaction.user} ({interaction.user.id})")
-                locked += 1
-            except Exception:
-                failed += 1
+        locked, failed = await _lock_guild(guild, True, reason=f"Lockdown by {interaction.user} ({interaction.user.id})")
 
         msg = f"✅ Lockdown enabled. Locked **{locked}** channels."
         if failed:
@@ -156,16 +153,7 @@ class Locks(commands.Cog):
         guild = interaction.guild
         await interaction.response.defer(ephemeral=True)
 
-        unlocked = 0
-        failed = 0
-        for ch in guild.text_channels:
-            if ch.name == "rules":
-                continue
-            try:
-                await _apply_lock(ch, False, reason=f"Unlockdown by {interaction.user} ({interaction.user.id})")
-                unlocked += 1
-            except Exception:
-                failed += 1
+        unlocked, failed = await _lock_guild(guild, False, reason=f"Unlockdown by {interaction.user} ({interaction.user.id})")
 
         msg = f"✅ Lockdown lifted. Unlocked **{unlocked}** channels."
         if failed:
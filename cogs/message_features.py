@@ -0,0 +1,95 @@
+import re
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import discord
+
+# Per-message features, computed once and shared by every on_message listener.
+
+TOKEN_RE = re.compile(r"(?P<link>https?://\S+)|(?P<emoji><a?:\w{2,32}:\d{15,25}>)", re.IGNORECASE)
+CACHE_SIZE = 512
+
+
+@dataclass(frozen=True)
+class MessageFeatures:
+    length: int
+    letters: int
+    caps: int
+    user_mentions: int
+    role_mentions: int
+    mentions_everyone: bool
+    links: int
+    emojis: int
+    max_run: int  # longest run of the same character
+    content_hash: str
+
+    @property
+    def caps_ratio(self) -> float:
+        return self.caps / max(self.letters, 1)
+
+
+def _is_emoji(cp: int) -> bool:
+    return 0x1F000 <= cp <= 0x1FAFF or 0x2600 <= cp <= 0x27BF
+
+
+def extract(content: str, *, user_mentions: int = 0, role_mentions: int = 0, mentions_everyone: bool = False) -> MessageFeatures:
+    letters = caps = emojis = 0
+    max_run = run = 0
+    prev = None
+    for ch in content:
+        if ch.isalpha():
+            letters += 1
+            if ch.isupper():
+                caps += 1
+        elif ord(ch) >= 0x2600 and _is_emoji(ord(ch)):
+            emojis += 1
+        if ch == prev:
+            run += 1
+        else:
+            run = 1
+            prev = ch
+        if run > max_run:
+            max_run = run
+
+    links = 0
+    for m in TOKEN_RE.finditer(content):
+        if m.lastgroup == "link":
+            links += 1
+        else:
+            emojis += 1
+
+    return MessageFeatures(
+        length=len(content),
+        letters=letters,
+        caps=caps,
+        user_mentions=user_mentions,
+        role_mentions=role_mentions,
+        mentions_everyone=mentions_everyone,
+        links=links,
+        emojis=emojis,
+        max_run=max_run,
+        content_hash=hashlib.blake2b(content.encode("utf-8"), digest_size=8).hexdigest(),
+    )
+
+
+_cache: "OrderedDict[tuple, MessageFeatures]" = OrderedDict()
+
+
+def features_for(message: discord.Message) -> MessageFeatures:
+    # memoized per (message id, edited_at) so an edited message is re-extracted
+    key = (message.id, message.edited_at)
+    feats = _cache.get(key)
+    if feats is not None:
+        _cache.move_to_end(key)
+        return feats
+    feats = extract(
+        message.content or "",
+        user_mentions=len(message.mentions),
+        role_mentions=len(message.role_mentions),
+        mentions_everyone=message.mention_everyone,
+    )
+    _cache[key] = feats
+    if len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+    return feats
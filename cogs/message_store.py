@@ -0,0 +1,259 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+
+import discord
+
+from cogs.bot_db import get_db
+
+# Compact copies of recent guild messages for delete/edit logging from raw events.
+
+STORE_DB_PATH = os.path.join("data", "message_store.db")
+RECORD_OVERHEAD_BYTES = 160  # rough per-record cost of the slots object, ints and dict entry
+SPILL_BATCH = 200
+SPILLED_ID_BYTES = 72  # rough cost of one int in the spilled-id set (int object + hash slot)
+SPILLED_ID_SHARE = 8  # the id index may use up to 1/8 of the budget; the rest holds records
+
+
+@dataclass(frozen=True, slots=True)
+class MessageRecord:
+    message_id: int
+    guild_id: int
+    channel_id: int
+    author_id: int
+    author_name: str
+    content: str
+    attachments: tuple  # ((filename, url), ...)
+
+    @property
+    def size(self) -> int:
+        return (RECORD_OVERHEAD_BYTES + len(self.content) + len(self.author_name)
+                + sum(len(f) + len(u) for f, u in self.attachments))
+
+    @property
+    def jump_url(self) -> str:
+        return f"https://discord.com/channels/{self.guild_id}/{self.channel_id}/{self.message_id}"
+
+
+def record_from_message(message: discord.Message) -> MessageRecord:
+    return MessageRecord(
+        message_id=message.id,
+        guild_id=message.guild.id,
+        channel_id=message.channel.id,
+        author_id=message.author.id,
+        author_name=str(message.author),
+        content=message.content or "",
+        attachments=tuple((a.filename, a.url) for a in message.attachments[:10]),
+    )
+
+
+def _create_schema(con):
+    con.execute("""CREATE TABLE IF NOT EXISTS messages(
+        message_id INTEGER PRIMARY KEY,
+        guild_id INTEGER NOT NULL,
+        channel_id INTEGER NOT NULL,
+        author_id INTEGER NOT NULL,
+        author_name TEXT NOT NULL,
+        content TEXT NOT NULL,
+        attachments TEXT NOT NULL,
+        stored_at INTEGER NOT NULL
+    )""")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_messages_stored ON messages(stored_at)")
+
+
+def _row_to_record(row) -> MessageRecord:
+    atts = tuple(tuple(line.split("\t", 1)) for line in row[6].split("\n") if "\t" in line)
+    return MessageRecord(row[0], row[1], row[2], row[3], row[4], row[5], atts)
+
+
+class MessageStore:
+    # LRU of MessageRecord bounded by an approximate byte budget. With spill enabled, evicted
+    # records are written to SQLite in batches on the BotDB worker thread. The most recently spilled
+    # ids are kept in a set (its size counted in the budget), so a memory miss only queries the file
+    # for ids in that set or older than it (snowflakes grow with time).
+    def __init__(self, budget_bytes: int, spill: bool = False, spill_days: int = 14, db_path: str = STORE_DB_PATH):
+        self.budget_bytes = budget_bytes
+        self._id_cap = budget_bytes // (SPILLED_ID_SHARE * SPILLED_ID_BYTES) if spill else 0
+        self._record_budget = budget_bytes - self._id_cap * SPILLED_ID_BYTES
+        self.spill = spill
+        self.spill_days = spill_days
+        self.db_path = db_path
+        self._items = OrderedDict()  # message_id -> MessageRecord
+        self._bytes = 0
+        self._pending = {}  # message_id -> evicted MessageRecord not yet written
+        self._writing = {}  # the batch a flush is writing right now
+        self._dropped = set()  # ids popped while their batch was being written
+        self._spilled = set()  # recently spilled message ids, at most _id_cap
+        self._spill_order = deque()  # the same ids in spill order, oldest first (may hold stale ids)
+        self._spilled_floor = 0  # ids <= this may be on disk without being in _spilled
+        self._ready = False  # schema created and _spilled loaded
+        self._flushing = None  # running flush task started by put()
+        self._flush_lock = asyncio.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.spilled = 0
+        self._db = None
+        if spill:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            self._db = get_db(db_path)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    async def open(self):
+        # create the table and load the ids already on disk; until then misses go to the file
+        if not self.spill or self._ready:
+            return
+        cutoff = int(time.time()) - self.spill_days * 86400
+
+        def _load_ids(con):
+            _create_schema(con)
+            return [r[0] for r in con.execute("SELECT message_id FROM messages WHERE stored_at>=? ORDER BY message_id",
+                                              (cutoff,))]
+
+        try:
+            self._track(await self._db.run(_load_ids))
+            self._ready = True
+        except Exception:
+            pass
+
+    def _track(self, ids):
+        for message_id in ids:
+            if message_id not in self._spilled:
+                self._spilled.add(message_id)
+                self._spill_order.append(message_id)
+        while len(self._spill_order) > self._id_cap:
+            old = self._spill_order.popleft()
+            if old in self._spilled:
+                self._spilled.discard(old)
+                self._spilled_floor = max(self._spilled_floor, old)
+
+    def _maybe_on_disk(self, message_id: int) -> bool:
+        return not self._ready or message_id in self._spilled or message_id <= self._spilled_floor
+
+    def put(self, rec: MessageRecord):
+        old = self._items.pop(rec.message_id, None)
+        if old is not None:
+            self._bytes -= old.size
+        self._items[rec.message_id] = rec
+        self._bytes += rec.size
+        while self._bytes > self._record_budget and self._items:
+            _, evicted = self._items.popitem(last=False)
+            self._bytes -= evicted.size
+            if self.spill:
+                self._pending[evicted.message_id] = evicted
+        if len(self._pending) >= SPILL_BATCH and (self._flushing is None or self._flushing.done()):
+            self._flushing = asyncio.get_running_loop().create_task(self.flush())
+
+    async def get(self, message_id: int) -> MessageRecord | None:
+        rec = self._items.get(message_id)
+        if rec is not None:
+            self._items.move_to_end(message_id)
+            self.hits += 1
+            return rec
+        rec = self._pending.get(message_id) or self._writing.get(message_id)
+        if rec is None:
+            rec = await self._load(message_id)
+        if rec is None:
+            self.misses += 1
+        else:
+            self.disk_hits += 1
+        return rec
+
+    async def update_content(self, message_id: int, content: str) -> MessageRecord | None:
+        # -> the record as it was before the edit
+        old = await self.get(message_id)
+        if old is not None:
+            self.put(MessageRecord(old.message_id, old.guild_id, old.channel_id, old.author_id,
+                                   old.author_name, content, old.attachments))
+        return old
+
+    async def pop(self, message_id: int) -> MessageRecord | None:
+        rec = self._items.pop(message_id, None)
+        if rec is not None:
+            self._bytes -= rec.size
+            self.hits += 1
+            return rec
+        rec = await self.get(message_id)
+        if rec is not None and self.spill:
+            self._pending.pop(message_id, None)
+            if self._writing.pop(message_id, None) is not None:
+                self._dropped.add(message_id)  # flush deletes it once its write lands
+            elif self._maybe_on_disk(message_id):
+                self._spilled.discard(message_id)
+                await self._delete(message_id)
+        return rec
+
+    async def _load(self, message_id: int) -> MessageRecord | None:
+        if not self.spill or not self._maybe_on_disk(message_id):
+            return None
+        try:
+            row = await self._db.fetchone("""SELECT message_id,guild_id,channel_id,author_id,author_name,content,attachments
+                                             FROM messages WHERE message_id=?""", (message_id,))
+        except Exception:
+            return None
+        return _row_to_record(row) if row else None
+
+    async def _delete(self, message_id: int):
+        try:
+            await self._db.execute("DELETE FROM messages WHERE message_id=?", (message_id,))
+        except Exception:
+            pass
+
+    async def flush(self):
+        # write evicted records and drop spilled rows older than spill_days
+        if not self.spill:
+            return
+        async with self._flush_lock:
+            await self._flush()
+
+    async def _flush(self):
+        await self.open()
+        batch, self._pending = self._pending, {}
+        self._writing = batch
+        now = int(time.time())
+        rows = [(r.message_id, r.guild_id, r.channel_id, r.author_id, r.author_name, r.content,
+                 "\n".join(f"{f}\t{u}" for f, u in r.attachments), now) for r in batch.values()]
+        cutoff = now - self.spill_days * 86400
+
+        def _write(con):
+            _create_schema(con)
+            con.executemany(
+                """INSERT OR REPLACE INTO messages(message_id,guild_id,channel_id,author_id,author_name,content,attachments,stored_at)
+                   VALUES(?,?,?,?,?,?,?,?)""", rows)
+            expired = [r[0] for r in con.execute("SELECT message_id FROM messages WHERE stored_at<?", (cutoff,))]
+            con.execute("DELETE FROM messages WHERE stored_at<?", (cutoff,))
+            return expired
+
+        try:
+            expired = await self._db.run(_write)
+        except Exception:
+            self._writing = {}
+            self._dropped.clear()  # popped from batch already, so they are not retried
+            batch.update(self._pending)  # retry next flush; newer evictions win
+            self._pending = batch
+            return
+        self._writing = {}
+        dropped, self._dropped = self._dropped, set()
+        self._spilled.difference_update(expired)
+        self._track(batch)
+        self.spilled += len(batch)
+        for message_id in dropped:
+            await self._delete(message_id)
+
+    def stats(self) -> dict:
+        return {
+            "records": len(self._items),
+            "bytes": self._bytes,
+            "budget": self.budget_bytes,
+            "pending_spill": len(self._pending),
+            "spilled": self.spilled,
+            "tracked_ids": len(self._spilled),
+            "id_bytes": len(self._spilled) * SPILLED_ID_BYTES,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+        }
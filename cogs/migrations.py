@@ -0,0 +1,182 @@
+import json
+import sqlite3
+
+# Schema migrations tracked with PRAGMA user_version.
+
+
+def migrate(con: sqlite3.Connection, steps) -> tuple[int, int]:
+    # -> (version before, version after)
+    start = con.execute("PRAGMA user_version").fetchone()[0]
+    version = start
+    for step in steps[start:]:
+        con.execute("BEGIN")
+        try:
+            step(con)
+            version += 1
+            con.execute(f"PRAGMA user_version={version}")
+            con.commit()
+        except Exception:
+            con.rollback()
+            raise
+    return start, version
+
+
+def _json_ids(raw) -> list[int]:
+    try:
+        return [int(x) for x in json.loads(raw or "[]")]
+    except Exception:
+        return []
+
+
+# ---- bot.db (appeals_moderation, giveaways and raid_guard share one version sequence) ----
+
+def _bot_v1_baseline(con):
+    # the tables as they existed before versioning; no-ops on an existing database
+    con.execute("""CREATE TABLE IF NOT EXISTS quarantine_bans(
+        guild_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        roles_json TEXT NOT NULL,
+        banned_by INTEGER NOT NULL,
+        ban_reason TEXT,
+        created_at INTEGER NOT NULL,
+        appeal_count INTEGER NOT NULL DEFAULT 0,
+        last_appeal_at INTEGER,
+        last_appeal_text TEXT,
+        last_decision TEXT,
+        last_decision_by INTEGER,
+        last_decision_at INTEGER,
+        PRIMARY KEY (guild_id, user_id)
+    )""")
+    con.execute("""CREATE TABLE IF NOT EXISTS rejoin_abuse(
+        guild_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        rejoin_count INTEGER NOT NULL DEFAULT 0,
+        last_rejoin_at INTEGER,
+        PRIMARY KEY (guild_id, user_id)
+    )""")
+    con.execute("""CREATE TABLE IF NOT EXISTS scheduled_permabans(
+        guild_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        execute_at INTEGER NOT NULL,
+        reason TEXT,
+        banned_by INTEGER NOT NULL,
+        PRIMARY KEY (guild_id, user_id)
+    )""")
+    con.execute("""CREATE TABLE IF NOT EXISTS mutes(
+        guild_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        ends_at INTEGER NOT NULL,
+        roles_json TEXT NOT NULL,
+        reason TEXT,
+        muted_by INTEGER NOT NULL,
+        PRIMARY KEY (guild_id, user_id)
+    )""")
+    con.execute("""CREATE TABLE IF NOT EXISTS giveaways(
+        message_id INTEGER PRIMARY KEY,
+        guild_id INTEGER NOT NULL,
+        channel_id INTEGER NOT NULL,
+        winners INTEGER NOT NULL,
+        prize TEXT NOT NULL,
+        end_ts REAL NOT NULL
+    )""")
+    con.execute("""CREATE TABLE IF NOT EXISTS giveaway_entries(
+        message_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        PRIMARY KEY (message_id, user_id)
+    )""")
+
+
+def _bot_v2_indexes(con):
+    con.execute("CREATE INDEX IF NOT EXISTS idx_mutes_ends_at ON mutes(ends_at)")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_permabans_execute_at ON scheduled_permabans(execute_at)")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_giveaways_guild ON giveaways(guild_id, message_id)")
+
+
+def _bot_v3_role_tables(con):
+    # roles_json -> one row per saved role; the parent tables are rebuilt without the column
+    con.execute("""CREATE TABLE IF NOT EXISTS quarantine_roles(
+        guild_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        role_id INTEGER NOT NULL,
+        PRIMARY KEY (guild_id, user_id, role_id)
+    )""")
+    con.execute("""CREATE TABLE IF NOT EXISTS mute_roles(
+        guild_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        role_id INTEGER NOT NULL,
+        PRIMARY KEY (guild_id, user_id, role_id)
+    )""")
+    for parent, child in (("quarantine_bans", "quarantine_roles"), ("mutes", "mute_roles")):
+        rows = con.execute(f"SELECT guild_id,user_id,roles_json FROM {parent}").fetchall()
+        con.executemany(f"INSERT OR IGNORE INTO {child}(guild_id,user_id,role_id) VALUES(?,?,?)",
+                        [(g, u, rid) for g, u, raw in rows for rid in _json_ids(raw)])
+
+    con.execute("""CREATE TABLE quarantine_bans_v3(
+        guild_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        banned_by INTEGER NOT NULL,
+        ban_reason TEXT,
+        created_at INTEGER NOT NULL,
+        appeal_count INTEGER NOT NULL DEFAULT 0,
+        last_appeal_at INTEGER,
+        last_appeal_text TEXT,
+        last_decision TEXT,
+        last_decision_by INTEGER,
+        last_decision_at INTEGER,
+        PRIMARY KEY (guild_id, user_id)
+    )""")
+    con.execute("""INSERT INTO quarantine_bans_v3
+                   SELECT guild_id,user_id,banned_by,ban_reason,created_at,appeal_count,last_appeal_at,last_appeal_text,
+                          last_decision,last_decision_by,last_decision_at
+                   FROM quarantine_bans""")
+    con.execute("DROP TABLE quarantine_bans")
+    con.execute("ALTER TABLE quarantine_bans_v3 RENAME TO quarantine_bans")
+
+    con.execute("""CREATE TABLE mutes_v3(
+        guild_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        ends_at INTEGER NOT NULL,
+        reason TEXT,
+        muted_by INTEGER NOT NULL,
+        PRIMARY KEY (guild_id, user_id)
+    )""")
+    con.execute("INSERT INTO mutes_v3 SELECT guild_id,user_id,ends_at,reason,muted_by FROM mutes")
+    con.execute("DROP TABLE mutes")
+    con.execute("ALTER TABLE mutes_v3 RENAME TO mutes")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_mutes_ends_at ON mutes(ends_at)")
+
+
+def _bot_v4_raid_lockdown(con):
+    # what the raid auto-lockdown changed, so a restart can still undo exactly that
+    con.execute("""CREATE TABLE IF NOT EXISTS raid_lockdowns(
+        guild_id INTEGER PRIMARY KEY,
+        ends_at REAL NOT NULL
+    )""")
+    con.execute("""CREATE TABLE IF NOT EXISTS raid_lock_overwrites(
+        guild_id INTEGER NOT NULL,
+        channel_id INTEGER NOT NULL,
+        target_id INTEGER NOT NULL,
+        allow_before INTEGER NOT NULL,
+        deny_before INTEGER NOT NULL,
+        allow_after INTEGER NOT NULL,
+        deny_after INTEGER NOT NULL,
+        PRIMARY KEY (guild_id, channel_id, target_id)
+    )""")
+    con.execute("""CREATE TABLE IF NOT EXISTS raid_lock_threads(
+        guild_id INTEGER NOT NULL,
+        thread_id INTEGER NOT NULL,
+        PRIMARY KEY (guild_id, thread_id)
+    )""")
+
+
+# step N upgrades user_version N-1 -> N; append new steps, never edit or reorder shipped ones
+BOT_DB_MIGRATIONS = [
+    _bot_v1_baseline,
+    _bot_v2_indexes,
+    _bot_v3_role_tables,
+    _bot_v4_raid_lockdown,
+]
+
+
+def migrate_bot_db(con: sqlite3.Connection) -> tuple[int, int]:
+    return migrate(con, BOT_DB_MIGRATIONS)
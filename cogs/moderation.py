@@ -2,12 +2,7 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 
-def is_mod(member: discord.Member) -> bool:
-    if member.guild_permissions.administrator:
-        return True
-    if member.guild_permissions.moderate_members or member.guild_permissions.kick_members or member.guild_permissions.ban_members:
-        return True
-    return any(r.name in {"Discord Moderator", "XonarousLIVE | Owner"} for r in member.roles)
+from cogs.permissions import is_mod
 
 class Moderation(commands.Cog):
     def __init__(self, bot: commands.Bot):
@@ -0,0 +1,63 @@
+import asyncio
+
+import discord
+
+# Channel overwrite reconciliation: only overwrites that differ cost a REST call.
+
+RECONCILE_CONCURRENCY = 4  # parallel set_permissions calls; discord.py still honours the route buckets
+
+BANNED_HIDDEN = {"view_channel": False, "send_messages": False}
+BANNED_CHANNEL = {"view_channel": True, "send_messages": False, "add_reactions": False, "send_messages_in_threads": False}
+BANNED_CHANNEL_EVERYONE = {"view_channel": False}
+SEND_DENIED = {  # Muted role, /lock and the raid lockdown all deny exactly these
+    "send_messages": False,
+    "add_reactions": False,
+    "create_public_threads": False,
+    "create_private_threads": False,
+    "send_messages_in_threads": False,
+}
+
+
+def differs(current: discord.PermissionOverwrite, desired: dict) -> bool:
+    return any(getattr(current, perm) != value for perm, value in desired.items())
+
+
+async def reconcile(plan, reason: str, concurrency: int = RECONCILE_CONCURRENCY) -> tuple[int, int]:
+    # plan: iterable of (channel, target role/member, desired {perm: value}); -> (changed, failed)
+    todo = []
+    for ch, target, desired in plan:
+        current = ch.overwrites_for(target)
+        if differs(current, desired):
+            current.update(**desired)  # keep any unrelated allow/deny bits
+            todo.append((ch, target, current))
+    if not todo:
+        return 0, 0
+
+    sem = asyncio.Semaphore(concurrency)
+
+    async def apply(ch, target, ow) -> bool:
+        async with sem:
+            try:
+                await ch.set_permissions(target, overwrite=ow, reason=reason)
+                return True
+            except Exception:
+                return False
+
+    results = await asyncio.gather(*(apply(*t) for t in todo))
+    changed = sum(results)
+    return changed, len(results) - changed
+
+
+def banned_plan(guild: discord.Guild, banned_role: discord.Role, banned_ch: discord.TextChannel, channels=None):
+    # #banned: hidden from everyone, read-only for Banned; every other text channel hidden from Banned
+    for ch in channels if channels is not None else guild.text_channels:
+        if ch.id == banned_ch.id:
+            yield ch, guild.default_role, BANNED_CHANNEL_EVERYONE
+            yield ch, banned_role, BANNED_CHANNEL
+        else:
+            yield ch, banned_role, BANNED_HIDDEN
+
+
+def muted_plan(guild: discord.Guild, muted_role: discord.Role, channels=None):
+    for ch in channels if channels is not None else guild.text_channels:
+        yield ch, muted_role, SEND_DENIED
@@ -0,0 +1,142 @@
+import discord
+from discord.ext import commands
+
+# Shared staff/admin check used by every cog. Loaded as an extension (first in bot.py)
+# so its listeners can invalidate the cache; other cogs import the tier they need
+# (is_automod_exempt / is_staff / is_mod / is_admin).
+
+ADMIN_ROLE_ID = 1450553389971800185  # Discord Admin role
+MOD_ROLE_NAMES = {"Discord Moderator", "XonarousLIVE | Owner"}
+AUTOMOD_EXEMPT_ROLE_NAME = "Discord Moderator"
+
+
+# Each tier keeps its cog's original definition; they are cached side by side, never unioned.
+
+def _automod_exempt(member: discord.Member, perms: discord.Permissions) -> bool:
+    # AutoMod skips these authors
+    return perms.administrator or perms.manage_messages or any(r.name == AUTOMOD_EXEMPT_ROLE_NAME for r in member.roles)
+
+
+def _staff(member: discord.Member, perms: discord.Permissions) -> bool:
+    # quarantine / appeals staff: /kick, /ban, /mute, /warn and appeal decisions
+    return (perms.administrator or perms.moderate_members or perms.kick_members or perms.ban_members
+            or any(r.id == ADMIN_ROLE_ID for r in member.roles))
+
+
+def _mod(member: discord.Member, perms: discord.Permissions) -> bool:
+    # /mod command group
+    return (perms.administrator or perms.moderate_members or perms.kick_members or perms.ban_members
+            or any(r.name in MOD_ROLE_NAMES for r in member.roles))
+
+
+def _admin(member: discord.Member, perms: discord.Permissions) -> bool:
+    return perms.administrator or any(r.id == ADMIN_ROLE_ID for r in member.roles)
+
+
+TIERS = {
+    "automod_exempt": _automod_exempt,
+    "staff": _staff,
+    "mod": _mod,
+    "admin": _admin,
+}
+
+
+class StaffCache:
+    # Per guild: ids resolved so far, and which of those pass each tier.
+    # Members are resolved lazily on first check; role and member updates drop stale entries.
+    def __init__(self):
+        self._guilds = {}  # guild_id -> {"resolved": set, <tier>: set, ...}
+        self.hits = 0
+        self.misses = 0
+
+    def _entry(self, member: discord.Member) -> dict:
+        g = self._guilds.get(member.guild.id)
+        if g is None:
+            g = self._guilds[member.guild.id] = {"resolved": set(), **{t: set() for t in TIERS}}
+        if member.id in g["resolved"]:
+            self.hits += 1
+            return g
+        self.misses += 1
+        perms = member.guild_permissions  # the one place that walks member.roles for permissions
+        for tier, check in TIERS.items():
+            if check(member, perms):
+                g[tier].add(member.id)
+        g["resolved"].add(member.id)
+        return g
+
+    def check(self, tier: str, member) -> bool:
+        if not isinstance(member, discord.Member):
+            return False
+        return member.id in self._entry(member)[tier]
+
+    def forget_member(self, guild_id: int, user_id: int):
+        g = self._guilds.get(guild_id)
+        if g:
+            for s in g.values():
+                s.discard(user_id)
+
+    def forget_guild(self, guild_id: int):
+        self._guilds.pop(guild_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "guilds": len(self._guilds),
+            "resolved": sum(len(g["resolved"]) for g in self._guilds.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+staff_cache = StaffCache()
+
+
+def is_automod_exempt(member) -> bool:
+    return staff_cache.check("automod_exempt", member)
+
+
+def is_staff(member) -> bool:
+    return staff_cache.check("staff", member)
+
+
+def is_mod(member) -> bool:
+    return staff_cache.check("mod", member)
+
+
+def is_admin(member) -> bool:
+    return staff_cache.check("admin", member)
+
+
+class PermissionCache(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        if before.roles != after.roles:
+            staff_cache.forget_member(after.guild.id, after.id)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member: discord.Member):
+        staff_cache.forget_member(member.guild.id, member.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before: discord.Role, after: discord.Role):
+        if before.permissions != after.permissions or before.name != after.name:
+            staff_cache.forget_guild(after.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role):
+        staff_cache.forget_guild(role.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_update(self, before: discord.Guild, after: discord.Guild):
+        if before.owner_id != after.owner_id:
+            staff_cache.forget_guild(after.id)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        staff_cache.forget_guild(guild.id)
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(PermissionCache(bot))
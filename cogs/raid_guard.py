@@ -0,0 +1,278 @@
+import time
+import asyncio
+from bisect import bisect_right
+from collections import deque
+
+import discord
+from discord import app_commands
+from discord.ext import commands, tasks
+
+from cogs.bot_db import get_db
+from cogs.locks import LOCK_ROLE_NAMES
+from cogs.migrations import migrate_bot_db
+from cogs.permissions import is_admin
+from cogs.overwrites import SEND_DENIED, RECONCILE_CONCURRENCY, differs
+
+BRAND_GREEN = discord.Colour.from_rgb(46, 204, 113)
+
+DB_PATH = "bot.db"
+db = get_db(DB_PATH)
+
+BUCKET_SECONDS = 5
+# account-age classes: <1h, <1d, <7d, <30d, older
+AGE_EDGES = (3600, 86400, 7 * 86400, 30 * 86400)
+YOUNG_CLASSES = 2  # "young" = the first two classes (< 1 day old)
+
+
+class JoinRateWindow:
+    # Sliding window of join counts in BUCKET_SECONDS buckets, each holding an account-age histogram.
+    def __init__(self, window: float):
+        self.window = window
+        self._buckets = deque()  # [bucket index, histogram]
+        self.hist = [0] * (len(AGE_EDGES) + 1)  # running totals across the window
+
+    def _evict(self, now: float):
+        oldest = int((now - self.window) // BUCKET_SECONDS)
+        while self._buckets and self._buckets[0][0] <= oldest:
+            _, h = self._buckets.popleft()
+            for i, c in enumerate(h):
+                self.hist[i] -= c
+
+    def add(self, now: float, account_age: float):
+        self._evict(now)
+        idx = int(now // BUCKET_SECONDS)
+        if not self._buckets or self._buckets[-1][0] != idx:
+            self._buckets.append([idx, [0] * len(self.hist)])
+        cls = bisect_right(AGE_EDGES, max(0.0, account_age))
+        self._buckets[-1][1][cls] += 1
+        self.hist[cls] += 1
+
+    def joins(self, now: float) -> int:
+        self._evict(now)
+        return sum(self.hist)
+
+    def young(self, now: float) -> int:
+        self._evict(now)
+        return sum(self.hist[:YOUNG_CLASSES])
+
+
+class RaidGuard(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self._windows = {}  # guild_id -> JoinRateWindow
+        self._seen = {}  # guild_id -> deque of recently counted member ids (dedupe across listeners)
+        self._raid_until = {}  # guild_id -> raid mode expiry
+        self._lock_tasks = {}  # guild_id -> running _auto_lock task
+        self.expire_raids.start()
+
+    def cog_unload(self):
+        self.expire_raids.cancel()
+
+    def _cfg(self):
+        return (getattr(self.bot, "xcfg", {}) or {}).get("raid", {}) or {}
+
+    def _modlog(self, guild: discord.Guild) -> discord.TextChannel | None:
+        name = (self.bot.xcfg.get("channels", {}) or {}).get("mod_log_channel_name", "mod-log")
+        return discord.utils.get(guild.text_channels, name=name)
+
+    def in_raid_mode(self, guild_id: int) -> bool:
+        return self._raid_until.get(guild_id, 0) > time.time()
+
+    def observe_join(self, member: discord.Member) -> bool:
+        # Count a join once (whichever on_member_join listener runs first) and return raid mode.
+        cfg = self._cfg()
+        if not cfg.get("enabled", True) or member.bot:
+            return self.in_raid_mode(member.guild.id)
+        seen = self._seen.setdefault(member.guild.id, deque(maxlen=256))
+        if member.id in seen:
+            return self.in_raid_mode(member.guild.id)
+        seen.append(member.id)
+
+        now = time.time()
+        window = float(cfg.get("window_seconds", 30))
+        win = self._windows.get(member.guild.id)
+        if win is None or win.window != window:
+            win = self._windows[member.guild.id] = JoinRateWindow(window)
+        win.add(now, now - member.created_at.timestamp())
+
+        joins, young = win.joins(now), win.young(now)
+        if joins >= int(cfg.get("join_threshold", 10)) or young >= int(cfg.get("young_threshold", 5)):
+            was = self.in_raid_mode(member.guild.id)
+            self._raid_until[member.guild.id] = now + float(cfg.get("raid_mode_minutes", 10)) * 60
+            if not was:
+                self.bot.loop.create_task(self._enter_raid_mode(member.guild, joins, young, window))
+        return self.in_raid_mode(member.guild.id)
+
+    async def _enter_raid_mode(self, guild: discord.Guild, joins: int, young: int, window: float):
+        cfg = self._cfg()
+        modlog = self._modlog(guild)
+        if modlog:
+            try:
+                await modlog.send(embed=discord.Embed(
+                    title="🚨 Raid mode enabled",
+                    colour=discord.Colour.red(),
+                    description=f"**{joins}** joins in {int(window)}s ({young} accounts < 1 day old).\n"
+                                f"Welcome messages and join DMs are paused for {cfg.get('raid_mode_minutes', 10)} min."
+                ))
+            except Exception:
+                pass
+        me = guild.me
+        if cfg.get("auto_lockdown", True) and me and me.guild_permissions.manage_channels:
+            task = self._lock_tasks[guild.id] = asyncio.ensure_future(
+                self._auto_lock(guild, reason="Raid mode: automatic lockdown"))
+            try:
+                locked, failed = await task
+            finally:
+                if self._lock_tasks.get(guild.id) is task:
+                    del self._lock_tasks[guild.id]
+            if modlog:
+                try:
+                    await modlog.send(f"🔒 Raid lockdown: locked **{locked}** channels" + (f" (failed: {failed})" if failed else ""))
+                except Exception:
+                    pass
+
+    async def _exit_raid_mode(self, guild: discord.Guild):
+        self._raid_until.pop(guild.id, None)
+        modlog = self._modlog(guild)
+        task = self._lock_tasks.get(guild.id)
+        if task is not None and not task.done():
+            # let the lockdown finish recording what it changed before undoing it
+            try:
+                await asyncio.shield(task)
+            except Exception:
+                pass
+        await self._auto_unlock(guild, reason="Raid mode ended: lifting automatic lockdown")
+        if modlog:
+            try:
+                await modlog.send(embed=discord.Embed(title="✅ Raid mode ended", colour=BRAND_GREEN,
+                                                      description="Join rate is back to normal."))
+            except Exception:
+                pass
+
+    async def _auto_lock(self, guild: discord.Guild, reason: str) -> tuple[int, int]:
+        # Like /lockdown, but only touches overwrites that aren't already locked and remembers each
+        # one as it was in bot.db, so the unlock (even after a restart) restores exactly those and
+        # leaves hand-made locks alone.
+        targets = [guild.default_role] + [r for r in guild.roles if r.name in LOCK_ROLE_NAMES]
+        await db.execute("INSERT OR REPLACE INTO raid_lockdowns(guild_id,ends_at) VALUES(?,?)",
+                         (guild.id, self._raid_until.get(guild.id, time.time())))
+        sem = asyncio.Semaphore(RECONCILE_CONCURRENCY)
+
+        async def lock_channel(ch: discord.TextChannel) -> bool:
+            async with sem:
+                ok = True
+                for target in targets:
+                    before = ch.overwrites_for(target)
+                    if not differs(before, SEND_DENIED):
+                        continue
+                    after = discord.PermissionOverwrite.from_pair(*before.pair())
+                    after.update(**SEND_DENIED)
+                    try:
+                        await ch.set_permissions(target, overwrite=after, reason=reason)
+                    except Exception:
+                        ok = False
+                        continue
+                    (allow_b, deny_b), (allow_a, deny_a) = before.pair(), after.pair()
+                    # OR IGNORE: a second lockdown before the unlock keeps the original state
+                    await db.execute("""INSERT OR IGNORE INTO raid_lock_overwrites
+                                        (guild_id,channel_id,target_id,allow_before,deny_before,allow_after,deny_after)
+                                        VALUES(?,?,?,?,?,?,?)""",
+                                     (guild.id, ch.id, target.id, allow_b.value, deny_b.value, allow_a.value, deny_a.value))
+                for th in ch.threads:
+                    if th.locked:
+                        continue
+                    try:
+                        await th.edit(locked=True, reason=reason)
+                    except Exception:
+                        continue
+                    await db.execute("INSERT OR IGNORE INTO raid_lock_threads(guild_id,thread_id) VALUES(?,?)",
+                                     (guild.id, th.id))
+                return ok
+
+        channels = [ch for ch in guild.text_channels if ch.name != "rules"]
+        results = await asyncio.gather(*(lock_channel(ch) for ch in channels))
+        done = sum(results)
+        return done, len(results) - done
+
+    async def _auto_unlock(self, guild: discord.Guild, reason: str):
+        overwrites = await db.fetchall("""SELECT channel_id,target_id,allow_before,deny_before,allow_after,deny_after
+                                          FROM raid_lock_overwrites WHERE guild_id=?""", (guild.id,))
+        threads = await db.fetchall("SELECT thread_id FROM raid_lock_threads WHERE guild_id=?", (guild.id,))
+        sem = asyncio.Semaphore(RECONCILE_CONCURRENCY)
+
+        async def restore(channel_id: int, target_id: int, allow_b: int, deny_b: int, allow_a: int, deny_a: int):
+            before = discord.PermissionOverwrite.from_pair(discord.Permissions(allow_b), discord.Permissions(deny_b))
+            after = discord.PermissionOverwrite.from_pair(discord.Permissions(allow_a), discord.Permissions(deny_a))
+            ch = guild.get_channel(channel_id)
+            target = guild.get_role(target_id)
+            # skip anything gone or edited by hand since the lockdown
+            if ch is None or target is None or ch.overwrites_for(target) != after:
+                return
+            async with sem:
+                try:
+                    await ch.set_permissions(target, overwrite=None if before.is_empty() else before, reason=reason)
+                except Exception:
+                    pass
+
+        await asyncio.gather(*(restore(*row) for row in overwrites))
+        for (thread_id,) in threads:
+            th = guild.get_thread(thread_id)
+            if th is None or not th.locked:
+                continue
+            try:
+                await th.edit(locked=False, reason=reason)
+            except Exception:
+                pass
+
+        def _clear(con):
+            for table in ("raid_lockdowns", "raid_lock_overwrites", "raid_lock_threads"):
+                con.execute(f"DELETE FROM {table} WHERE guild_id=?", (guild.id,))
+
+        await db.run(_clear)
+
+    @tasks.loop(seconds=15)
+    async def expire_raids(self):
+        now = time.time()
+        for guild_id, until in list(self._raid_until.items()):
+            if until > now:
+                continue
+            guild = self.bot.get_guild(guild_id)
+            if guild is None:
+                self._raid_until.pop(guild_id, None)
+                continue
+            await self._exit_raid_mode(guild)
+
+    @expire_raids.before_loop
+    async def _before_expire(self):
+        await self.bot.wait_until_ready()
+        # lockdowns from before a restart: resume raid mode until it was due to end, then unlock
+        try:
+            for guild_id, ends_at in await db.fetchall("SELECT guild_id,ends_at FROM raid_lockdowns"):
+                self._raid_until[guild_id] = max(self._raid_until.get(guild_id, 0), float(ends_at))
+        except Exception as e:
+            print(f"⚠️ RaidGuard: loading saved lockdowns failed: {e}")
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member):
+        self.observe_join(member)
+
+    @app_commands.command(name="raidmode", description="Show or end raid mode (admins only).")
+    async def raidmode(self, interaction: discord.Interaction, end: bool = False):
+        if not interaction.guild or not is_admin(interaction.user):
+            return await interaction.response.send_message("Admins only.", ephemeral=True)
+        guild = interaction.guild
+        if end and self.in_raid_mode(guild.id):
+            await interaction.response.defer(ephemeral=True)
+            await self._exit_raid_mode(guild)
+            return await interaction.followup.send("✅ Raid mode ended.", ephemeral=True)
+        win = self._windows.get(guild.id)
+        now = time.time()
+        joins = win.joins(now) if win else 0
+        young = win.young(now) if win else 0
+        state = f"ON for {int(self._raid_until[guild.id] - now)}s more" if self.in_raid_mode(guild.id) else "off"
+        await interaction.response.send_message(f"🚨 Raid mode: **{state}** • joins in window: **{joins}** ({young} young)", ephemeral=True)
+
+
+async def setup(bot: commands.Bot):
+    await db.run(migrate_bot_db)  # raid lockdown tables share bot.db's version sequence
+    await bot.add_cog(RaidGuard(bot))
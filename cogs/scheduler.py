@@ -0,0 +1,118 @@
+import time
+import heapq
+import asyncio
+import itertools
+
+from discord.ext import commands
+
+# Shared timer scheduler. Loaded as an extension (early in bot.py) so it can start after the bot
+# is ready; other cogs import `scheduler` and register a handler per job kind. Jobs are persisted by
+# their owning cog's own table (mutes, scheduled_permabans, giveaways); each kind's loader re-reads
+# that table at startup, so the heap only ever holds the pending deadlines.
+
+
+class TimerScheduler:
+    def __init__(self):
+        self._heap = []  # (fire_at, seq, kind, key)
+        self._live = {}  # (kind, key) -> fire_at; heap entries that don't match are stale
+        self._seq = itertools.count()
+        self._handlers = {}  # kind -> async handler(key)
+        self._loaders = {}  # kind -> async loader() -> [(fire_at, key), ...]
+        self._wake = asyncio.Event()
+        self._task = None
+        self.fired = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def register(self, kind: str, handler, loader=None):
+        self._handlers[kind] = handler
+        if loader is not None:
+            self._loaders[kind] = loader
+            if self.running:
+                asyncio.get_running_loop().create_task(self._load(kind))
+
+    def unregister(self, kind: str):
+        self._handlers.pop(kind, None)
+        self._loaders.pop(kind, None)
+
+    def schedule(self, kind: str, key, fire_at: float):
+        # (re)arm a timer; the caller persists the job in its own table first
+        self._live[(kind, key)] = fire_at
+        heapq.heappush(self._heap, (fire_at, next(self._seq), kind, key))
+        if self._heap[0][2:] == (kind, key):
+            self._wake.set()
+
+    def cancel(self, kind: str, key):
+        self._live.pop((kind, key), None)
+
+    def pending(self) -> int:
+        return len(self._live)
+
+    async def _load(self, kind: str):
+        try:
+            for fire_at, key in await self._loaders[kind]():
+                self.schedule(kind, key, float(fire_at))
+        except Exception as e:
+            print(f"⚠️ Scheduler: loading {kind} timers failed: {e}")
+
+    def start(self, bot: commands.Bot):
+        if not self.running:
+            self._task = bot.loop.create_task(self._run(bot))
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self, bot: commands.Bot):
+        await bot.wait_until_ready()
+        for kind in list(self._loaders):
+            await self._load(kind)
+        while True:
+            self._wake.clear()
+            while self._heap:
+                fire_at, _, kind, key = self._heap[0]
+                if self._live.get((kind, key)) != fire_at:
+                    heapq.heappop(self._heap)  # cancelled or re-armed
+                    continue
+                if fire_at > time.time():
+                    break
+                heapq.heappop(self._heap)
+                del self._live[(kind, key)]
+                self.fired += 1
+                asyncio.get_running_loop().create_task(self._fire(kind, key))
+            timeout = max(0.0, self._heap[0][0] - time.time()) if self._heap else None
+            try:
+                # sleep until the next deadline, or until schedule() arms an earlier one
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fire(self, kind: str, key):
+        handler = self._handlers.get(kind)
+        if handler is None:
+            return  # owning cog unloaded; its row stays in the db for the next start
+        try:
+            await handler(key)
+        except Exception as e:
+            print(f"⚠️ Scheduler: {kind} {key} failed: {e}")
+
+
+scheduler = TimerScheduler()
+
+
+class Scheduler(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+    async def cog_load(self):
+        scheduler.start(self.bot)
+
+    async def cog_unload(self):
+        scheduler.stop()
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Scheduler(bot))
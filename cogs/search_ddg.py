@@ -10,17 +10,12 @@ from discord.ext import commands
 
 from ddgs import DDGS
 
-BRAND_GREEN = discord.Colour.from_rgb(46, 204, 113)
+from cogs.permissions import is_admin
 
-ADMIN_ROLE_ID = 1450553389971800185  # your Discord Admin role id
+BRAND_GREEN = discord.Colour.from_rgb(46, 204, 113)
 
 WIKI_SUMMARY = "https://en.wikipedia.org/api/rest_v1/page/summary/{title}"
 
-def is_admin(member: discord.Member) -> bool:
-    if member.guild_permissions.administrator:
-        return True
-    return any(r.id == ADMIN_ROLE_ID for r in member.roles)
-
 class SearchView(discord.ui.View):
     def __init__(self, *, owner_id: int, query: str, results: list[dict], per_page: int = 5):
         super().__init__(timeout=180)
@@ -76,6 +76,9 @@ class Verification(commands.Cog):
                 await member.add_roles(unv, reason="New member unverified")
             except Exception:
                 pass
+        guard = self.bot.get_cog("RaidGuard")
+        if guard and guard.observe_join(member):
+            return  # raid mode: keep the Unverified gate, skip the DM
         await self._dm_join(member)
 
     async def _verify_member(self, guild: discord.Guild, member: discord.Member):
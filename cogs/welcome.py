@@ -13,6 +13,9 @@ class Welcome(commands.Cog):
         cfg = self._cfg()
         if not cfg.get("enabled", True):
             return
+        guard = self.bot.get_cog("RaidGuard")
+        if guard and guard.observe_join(member):
+            return  # raid mode: no welcome fan-out
         ch_name = (self.bot.xcfg.get("channels", {}) or {}).get("welcome_channel_name", "welcome")
         ch = discord.utils.get(member.guild.text_channels, name=ch_name)
         if not ch: